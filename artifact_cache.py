@@ -0,0 +1,143 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+# A content-addressed store for rendered documents (PDF, HTML, .tex, ...).
+# Entries are keyed by the hash of the Rmd source (with its dependencies)
+# plus the render options, so a document whose inputs have been rendered
+# before, anywhere in any checkout sharing the cache, is restored by copying
+# instead of being rendered again. The cache keeps its total size under a
+# budget by evicting the least recently used entries.
+#
+# Layout: <root>/objects/<key[:2]>/<key>/<output files> and <root>/index.json
+# holding {key: {"files": [...], "size": bytes, "used": timestamp}}.
+
+default_cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "r-course-artifacts")
+default_max_bytes = 1 << 30
+
+
+def parse_size(text):
+    """Parses sizes such as 500M, 2G or 1048576 into bytes."""
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    text = text.strip().upper().rstrip("B")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def cache_key(source_key, options):
+    """Combines a source hash with the render options that affect the output."""
+    h = hashlib.sha256(source_key.encode("utf-8"))
+    h.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+class ArtifactCache:
+    def __init__(self, root=default_cache_dir, max_bytes=default_max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(root, "index.json")
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+        self.dirty = False
+
+    def entry_dir(self, key):
+        return os.path.join(self.root, "objects", key[:2], key)
+
+    def total_size(self):
+        return sum(entry["size"] for entry in self.index.values())
+
+    def get(self, key, dest_dir):
+        """
+        Copies the outputs stored under key into dest_dir and returns their
+        paths, or returns None on a miss (including an entry whose files have
+        gone missing, which is dropped).
+        """
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        entry_dir = self.entry_dir(key)
+        restored = []
+        try:
+            for name in entry["files"]:
+                dest = os.path.join(dest_dir, name)
+                shutil.copyfile(os.path.join(entry_dir, name), dest)
+                restored.append(dest)
+        except OSError:
+            self.remove(key)
+            return None
+        entry["used"] = time.time()
+        self.dirty = True
+        return restored
+
+    def put(self, key, paths):
+        """Stores copies of the given output files under key, then evicts down to the budget."""
+        entry_dir = self.entry_dir(key)
+        tmp_dir = entry_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        size = 0
+        for path in paths:
+            shutil.copyfile(path, os.path.join(tmp_dir, os.path.basename(path)))
+            size += os.path.getsize(path)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+        self.index[key] = {"files": [os.path.basename(path) for path in paths], "size": size, "used": time.time()}
+        self.dirty = True
+        self.evict()
+
+    def remove(self, key):
+        shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+        if self.index.pop(key, None) is not None:
+            self.dirty = True
+
+    def evict(self, max_bytes=None):
+        """Drops least recently used entries until the cache fits max_bytes. Returns the evicted keys."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        total = self.total_size()
+        evicted = []
+        for key, entry in sorted(self.index.items(), key=lambda item: item[1]["used"]):
+            if total <= max_bytes:
+                break
+            total -= entry["size"]
+            self.remove(key)
+            evicted.append(key)
+        return evicted
+
+    def save(self):
+        """Writes the index back if anything changed."""
+        if not self.dirty:
+            return
+        with open(self.index_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(self.index_path + ".tmp", self.index_path)
+        self.dirty = False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or trim the rendered artifact cache.")
+    parser.add_argument("--cache-dir", default=default_cache_dir, help=f"cache location (default: {default_cache_dir})")
+    parser.add_argument("--max-size", type=parse_size, default=default_max_bytes,
+                        help="size budget, e.g. 500M or 2G (default: 1G)")
+    parser.add_argument("--evict", action="store_true", help="evict entries until the cache fits --max-size")
+    parser.add_argument("--clear", action="store_true", help="remove every entry")
+    args = parser.parse_args(argv)
+    cache = ArtifactCache(args.cache_dir, args.max_size)
+    if args.clear:
+        for key in list(cache.index):
+            cache.remove(key)
+    elif args.evict:
+        print(f"Evicted {len(cache.evict())} entr(y/ies).")
+    cache.save()
+    print(f"{len(cache.index)} entr(y/ies), {cache.total_size()} of {cache.max_bytes} bytes in {cache.root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import argparse
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import generate
+
+# Generates one customized copy of the course per cohort. Each cohort is the
+# base outline plus a small overlay of lessons that replace or add to it.
+#
+# The base is generated once (incrementally, so nightly reruns only touch
+# what changed) into <out>/.base. Each cohort tree is then assembled in a
+# fresh staging directory: every base file the overlay leaves alone is hard-
+# linked (or reflinked, or copied) from the base, only the overlay's own
+# files are written, and the base's manifest, which already holds every
+# other hash, is copied with just those files and their modules and phases
+# updated. The new tree is swapped in with the staged build's publish step.
+# Cohorts are built in parallel on a process pool; a worker is sent only its
+# overlay, never the base outline.
+#
+# Overridden files are never linked. Cohort trees share inodes with the
+# base, so keeping them apart relies on every later write to a linked file
+# replacing it rather than writing through it, as DiskBackend.open_write
+# does for the nightly base build.
+
+base_dirname = ".base"
+
+
+def overlay_files(overlay, base_modules, formats):
+    """
+    Returns {rel_path: data} for every file an overlay's lessons produce,
+    including the .Rproj of a module the base (base_modules, its manifest's
+    module keys) does not have yet.
+    """
+    from outline_io import natural_key
+    files = {}
+    for phase_name, modules_dict in overlay.items():
+        for module_name, lessons_dict in modules_dict.items():
+            new_module = f"{phase_name}/{module_name}" not in base_modules
+            for i, lesson_filename in enumerate(sorted(lessons_dict, key=natural_key)):
+                data = lessons_dict[lesson_filename].encode("utf-8")
+                files.update(generate.record_files(phase_name, module_name, lesson_filename, data, formats,
+                                                   first_in_module=new_module and i == 0))
+    return files
+
+
+def patch_manifest(manifest, rel_paths):
+    """
+    Brings the module and phase hashes of manifest up to date after the
+    files at rel_paths changed, hashing in natural order as a full run does.
+    """
+    from outline_io import natural_key
+    modules = {rel_path.rpartition("/")[0] for rel_path in rel_paths if rel_path.count("/") == 2}
+    lessons = {}
+    for rel_path in manifest["files"]:
+        module_key, _, lesson_filename = rel_path.rpartition("/")
+        if module_key in modules and rel_path.count("/") == 2:
+            lessons.setdefault(module_key, []).append(lesson_filename)
+    for module_key, lesson_filenames in lessons.items():
+        manifest["modules"][module_key] = generate.combined_hash(
+            (lesson, manifest["files"][f"{module_key}/{lesson}"]["sha256"])
+            for lesson in sorted(lesson_filenames, key=natural_key))
+    phases = {module_key.partition("/")[0] for module_key in modules}
+    phase_modules = {}
+    for module_key in manifest["modules"]:
+        phase_name, _, module_name = module_key.partition("/")
+        if phase_name in phases:
+            phase_modules.setdefault(phase_name, []).append(module_name)
+    for phase_name, module_names in phase_modules.items():
+        manifest["phases"][phase_name] = generate.combined_hash(
+            (module, manifest["modules"][f"{phase_name}/{module}"])
+            for module in sorted(module_names, key=natural_key))
+
+
+def build_cohort(base_dir, cohort_dir, overlay, formats=("md",)):
+    """
+    Builds one cohort tree from the generated base and publishes it at
+    cohort_dir. Runs in a worker process. Returns the generation summary.
+    """
+    generate.logger.setLevel("WARNING")
+    manifest = generate.load_manifest(base_dir)
+    files = overlay_files(overlay, manifest["modules"], formats)
+    stats = generate.GenerationStats()
+    staging_dir = generate.create_staging_dir(cohort_dir)
+    try:
+        linked = 0
+        for rel_path in manifest["files"]:
+            if rel_path in files:
+                continue
+            src = os.path.join(base_dir, rel_path)
+            dst = os.path.join(staging_dir, rel_path)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            generate.materialize(src, dst)
+            linked += 1
+        for rel_path, data in files.items():
+            path = os.path.join(staging_dir, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+            manifest["files"][rel_path] = {"sha256": generate.content_hash(data), "size": len(data)}
+            stats.record(rel_path, True, len(data))
+        patch_manifest(manifest, files)
+        generate.save_manifest(staging_dir, manifest)
+        generate.publish_staged(staging_dir, cohort_dir)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    summary = stats.as_dict()
+    summary["files_linked"] = linked
+    return summary
+
+
+def generate_cohorts(out_root, base_outline, overlays, jobs=None, formats=("md",)):
+    """
+    Generates base_outline once into out_root/.base, then one tree per
+    entry of overlays ({cohort name: overlay outline}) at out_root/<name>,
+    on up to `jobs` processes. Returns {".base": summary, cohort: summary}.
+    """
+    base_dir = os.path.join(out_root, base_dirname)
+    generate.logger.info("Building the base course in '%s'...", base_dir)
+    results = {base_dirname: generate.create_course_materials(base_dir, base_outline, incremental=True,
+                                                        prune=True, formats=formats)}
+    errors = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {name: pool.submit(build_cohort, base_dir, os.path.join(out_root, name), overlay, formats)
+                   for name, overlay in overlays.items()}
+        for name, future in futures.items():
+            try:
+                results[name] = summary = future.result()
+            except (OSError, generate.CourseGenerationError) as error:
+                errors.append((os.path.join(out_root, name), error))
+                continue
+            generate.logger.info("  %s: %d linked, %d written", name, summary["files_linked"],
+                                 summary["files_written"])
+    if errors:
+        raise generate.CourseGenerationError(errors)
+    generate.logger.info("Built %d cohort(s) in '%s'.", len(overlays), out_root)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate one course tree per cohort from a shared base.")
+    parser.add_argument("overlays", nargs="+",
+                        help="overlay outlines (JSON/TOML/Markdown file or directory), one per cohort; "
+                             "the cohort is named after the file or directory")
+    parser.add_argument("--output", default="cohorts", help="directory to build the cohorts in (default: cohorts)")
+    parser.add_argument("--outline", metavar="PATH", help="base outline to load instead of the built-in one")
+    parser.add_argument("--formats", default="md", type=lambda text: tuple(text.split(",")),
+                        help=f"comma-separated formats, from: {', '.join(generate.output_formats)} (default: md)")
+    parser.add_argument("-j", "--jobs", type=int, help="number of cohort processes (default: CPU count)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only report warnings and errors")
+    args = parser.parse_args(argv)
+    generate.configure_logging(-1 if args.quiet else 0)
+    try:
+        generate.check_formats(args.formats)
+    except ValueError as error:
+        parser.error(str(error))
+
+    import outline_io
+    try:
+        base_outline = outline_io.load_outline(args.outline) if args.outline else generate.course_outline
+        overlays = {}
+        for path in args.overlays:
+            name = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+            if name in overlays or name == base_dirname:
+                parser.error(f"duplicate cohort name '{name}'")
+            overlays[name] = outline_io.load_outline(path)
+    except (OSError, outline_io.OutlineError) as error:
+        parser.exit(1, f"error: {error}\n")
+    try:
+        generate_cohorts(args.output, base_outline, overlays, args.jobs, args.formats)
+    except generate.CourseGenerationError as error:
+        generate.flush_log()
+        parser.exit(1, f"error: {error}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import generate
+
+# Benchmarks generate.py on synthetic outlines. Every case (outline size x
+# backend x target filesystem) runs in a fresh child process so that peak RSS
+# and I/O call counts belong to that case alone. The counts are the read and
+# write call totals Linux keeps in /proc/self/io (read_calls, write_calls);
+# other system calls (openat, mkdir, stat, rename, link, ...) are not
+# measured. Results are appended to a JSON Lines file tagged with the current
+# git commit, and --compare checks the latest results against those of an
+# earlier commit.
+
+default_results = "bench_results.jsonl"
+
+# backend name -> keyword arguments for create_course_materials, or the
+# archive extension for create_course_archive
+backends = {
+    "serial": {},
+    "jobs8": {"jobs": 8},
+    "incremental": {"incremental": True},
+    "staged": {"staged": True},
+    "dedup": {"dedup": True},
+    "zip": ".zip",
+    "tgz": ".tar.gz",
+}
+
+
+def synthetic_records(lessons, body_size, phases, modules):
+    """
+    Yields (phase, module, lesson_filename, content) records for an outline
+    of `lessons` lessons spread evenly over `phases` phases of `modules`
+    modules each. Bodies are generated on the fly, so even 10^6 lessons never
+    sit in memory together.
+    """
+    per_module = max(1, -(-lessons // (phases * modules)))
+    filler = ("* Lorem ipsum dolor sit amet, `mean()` and `lm()` consectetur.\n" * (body_size // 60 + 1))
+    count = 0
+    for p in range(1, phases + 1):
+        for m in range(1, modules + 1):
+            phase_name = f"Phase_{p}_Synthetic"
+            module_name = f"Module_{p}.{m}_Synthetic"
+            for n in range(1, per_module + 1):
+                if count == lessons:
+                    return
+                header = f"# Lesson {n}: Synthetic lesson {p}.{m}.{n}\n\n"
+                yield phase_name, module_name, f"lesson_{n}_Synthetic.md", (header + filler)[:max(body_size, len(header))]
+                count += 1
+
+
+def read_proc_io():
+    """
+    Returns this process's read and write call counts (the syscr and syscw
+    of /proc/self/io: read-like and write-like system calls only), or {}
+    where /proc does not expose them.
+    """
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return {"read_calls": int(fields["syscr"]), "write_calls": int(fields["syscw"])}
+    except (OSError, KeyError, ValueError):
+        return {}
+
+
+def run_case(case):
+    """Runs one benchmark case in this process and returns its measurements."""
+    generate.logger.setLevel("WARNING")
+
+    def records():
+        return synthetic_records(case["lessons"], case["body_size"], case["phases"], case["modules"])
+
+    work_dir = tempfile.mkdtemp(prefix="course-bench-", dir=case["target_dir"])
+    out_dir = os.path.join(work_dir, "course")
+    try:
+        backend = backends[case["backend"]]
+        if isinstance(backend, dict) and backend.get("incremental"):
+            generate.create_course_materials(out_dir, records())
+        io_before = read_proc_io()
+        start = time.perf_counter()
+        if isinstance(backend, dict):
+            generate.create_course_materials(out_dir, records(), **backend)
+        else:
+            generate.create_course_archive(out_dir + backend, records())
+        wall = time.perf_counter() - start
+        io_after = read_proc_io()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    files = case["lessons"] + 1
+    result = {
+        "wall_seconds": round(wall, 6),
+        "files_per_second": round(files / wall, 1) if wall > 0 else None,
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == "darwin" else 1),
+    }
+    for key in io_after:
+        result[key] = io_after[key] - io_before.get(key, 0)
+    return result
+
+
+def case_key(case):
+    return (case["backend"], case["target"], case["lessons"], case["body_size"], case["phases"], case["modules"])
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def default_targets():
+    targets = {"disk": tempfile.gettempdir()}
+    if os.path.isdir("/dev/shm"):
+        targets["tmpfs"] = "/dev/shm"
+    return targets
+
+
+def run_benchmarks(args):
+    targets = default_targets()
+    if args.disk_dir:
+        targets["disk"] = args.disk_dir
+    if args.tmpfs_dir:
+        targets["tmpfs"] = args.tmpfs_dir
+    selected = args.targets.split(",") if args.targets else sorted(targets)
+    commit = git_commit()
+
+    with open(args.results, "a", encoding="utf-8") as results:
+        for lessons in args.sizes:
+            for backend in args.backends.split(","):
+                for target in selected:
+                    case = {"backend": backend, "target": target, "target_dir": targets[target],
+                            "lessons": lessons, "body_size": args.body_size,
+                            "phases": args.phases, "modules": args.modules}
+                    child = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-case", json.dumps(case)],
+                                           capture_output=True, text=True)
+                    if child.returncode != 0:
+                        print(f"{backend:12} {target:6} {lessons:>8} FAILED\n{child.stderr}", file=sys.stderr)
+                        continue
+                    result = json.loads(child.stdout)
+                    del case["target_dir"]
+                    record = {"commit": commit, "timestamp": int(time.time()), **case, **result}
+                    results.write(json.dumps(record) + "\n")
+                    results.flush()
+                    print(f"{backend:12} {target:6} {lessons:>8} lessons  {result['wall_seconds']:9.3f}s  "
+                          f"{result['files_per_second'] or 0:>10.0f} files/s  {result['peak_rss_kib']:>8} KiB  "
+                          f"write calls={result.get('write_calls', '-')}")
+
+
+def compare_results(path, baseline, candidate=None, threshold=0.10):
+    """
+    Compares the wall time of every case measured for both commits (the
+    latest record of each wins). Returns the list of regressions slower than
+    baseline by more than `threshold`.
+    """
+    by_commit = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            by_commit.setdefault(record["commit"], {})[case_key(record)] = record
+    if candidate is None:
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        candidate = json.loads(lines[-1])["commit"] if lines else None
+    base, new = by_commit.get(baseline, {}), by_commit.get(candidate, {})
+    regressions = []
+    for key in sorted(set(base) & set(new)):
+        ratio = new[key]["wall_seconds"] / base[key]["wall_seconds"] if base[key]["wall_seconds"] else 1.0
+        flag = "REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{key[0]:12} {key[1]:6} {key[2]:>8}  {base[key]['wall_seconds']:9.3f}s -> "
+              f"{new[key]['wall_seconds']:9.3f}s  x{ratio:5.2f} {flag}")
+        if flag:
+            regressions.append((key, ratio))
+    return regressions
+
+
+def measure_startup(commands, runs=10):
+    """Returns the median wall time in ms of running each command (an argv list) to completion."""
+    results = {}
+    for argv in commands:
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable] + argv, stdout=subprocess.DEVNULL, check=True)
+            times.append((time.perf_counter() - start) * 1000)
+        results[" ".join(argv)] = sorted(times)[len(times) // 2]
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the course generator on synthetic outlines.")
+    parser.add_argument("--sizes", type=lambda s: [int(float(n)) for n in s.split(",")], default=[100, 1000, 10000],
+                        help="comma-separated lesson counts, e.g. 1e2,1e4,1e6 (default: 100,1000,10000)")
+    parser.add_argument("--body-size", type=int, default=1024, help="bytes per lesson body (default: 1024)")
+    parser.add_argument("--phases", type=int, default=7, help="number of phases (default: 7)")
+    parser.add_argument("--modules", type=int, default=4, help="modules per phase (default: 4)")
+    parser.add_argument("--backends", default="serial,jobs8,incremental,zip",
+                        help=f"comma-separated backends from: {', '.join(backends)}")
+    parser.add_argument("--targets", help="comma-separated targets: disk, tmpfs (default: all available)")
+    parser.add_argument("--disk-dir", help="directory on a regular disk to generate into")
+    parser.add_argument("--tmpfs-dir", help="directory on tmpfs to generate into (default: /dev/shm)")
+    parser.add_argument("--results", default=default_results,
+                        help=f"JSON Lines file results are appended to (default: {default_results})")
+    parser.add_argument("--compare", metavar="COMMIT",
+                        help="compare the latest results in --results against COMMIT's instead of running")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="slowdown ratio reported as a regression by --compare (default: 0.10)")
+    parser.add_argument("--startup", action="store_true",
+                        help="instead of generating, time the CLI's --help startup against --startup-budget")
+    parser.add_argument("--startup-budget", type=float, default=50.0,
+                        help="milliseconds 'course.py --help' may take, median of 10 runs (default: 50)")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        print(json.dumps(run_case(json.loads(args.run_case))))
+        return
+    if args.startup:
+        course = os.path.join(os.path.dirname(os.path.abspath(__file__)), "course.py")
+        results = measure_startup([["-c", "pass"], [course, "--help"], [course, "generate", "--help"]])
+        for command, ms in results.items():
+            print(f"{command.replace(course, 'course.py'):30} {ms:8.1f} ms")
+        if results[f"{course} --help"] > args.startup_budget:
+            print(f"course.py --help is over the {args.startup_budget:.0f} ms budget", file=sys.stderr)
+            sys.exit(1)
+        return
+    if args.compare:
+        if compare_results(args.results, args.compare, threshold=args.threshold):
+            sys.exit(1)
+        return
+    for backend in args.backends.split(","):
+        if backend not in backends:
+            parser.error(f"unknown backend '{backend}'")
+    run_benchmarks(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+
+import generate
+import render
+
+# Extracts the code chunks (```{r label, echo=FALSE} ... ```) of the R
+# Markdown lessons in a course tree and keeps a persistent index of them:
+# chunk id, lesson, engine, options, line and a hash of the code. Only files
+# whose size or mtime moved are read again, and only files whose content
+# actually changed are parsed again, so refreshing the index of an unchanged
+# course costs one stat per lesson.
+#
+# Tangling writes each R chunk to its own script, <out>/<lesson>/<label>.R,
+# with a knitr::purl style header. An unlabelled chunk's script is named
+# after its code hash rather than its position (knitr's unnamed-chunk-N,
+# which purl leaves out of the header too), so inserting a chunk does not
+# rename every script after it. Scripts are rewritten only when the chunk's
+# hash or options differ from those they were last written with (recorded
+# in the index for the last tangle directory), and scripts of
+# chunks that disappeared are removed, so downstream linting and execution
+# can work off the changed scripts alone.
+
+index_filename = ".chunk_index.json"
+index_version = 2
+
+fence_pattern = re.compile(r"^([ \t]*)(`{3,})\s*\{\s*([A-Za-z0-9_]+)(.*)\}\s*$")
+
+
+def split_options(text):
+    """Splits a chunk header on commas that are not inside quotes or brackets."""
+    parts, depth, quote, start = [], 0, None, 0
+    for i, char in enumerate(text):
+        if quote:
+            if char == quote and text[i - 1] != "\\":
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+def parse_header(text):
+    """Returns (label, options) from what follows the engine in a chunk header."""
+    label, options = None, {}
+    for i, part in enumerate(split_options(text.lstrip(", "))):
+        if "=" in part and not part.startswith(("'", '"')):
+            name, value = part.split("=", 1)
+            options[name.strip()] = value.strip()
+        elif i == 0:
+            label = part.strip("\"'")
+    explicit = options.pop("label", None)
+    if explicit:
+        label = explicit.strip("\"'")
+    return label, options
+
+
+def parse_chunks(text):
+    """
+    Returns the chunks of an R Markdown document as dicts with "id", "named",
+    "engine", "options", "line" (1-based, of the opening fence) and "code".
+    Unlabelled chunks are numbered like knitr does: unnamed-chunk-1,
+    unnamed-chunk-2, ... (with "named" false) and a repeated label (which
+    knitr rejects) gets a -2, -3, ... suffix.
+    Fences may be indented (inside list items); the indent is stripped from
+    the code. An unterminated chunk runs to the end of the document.
+    """
+    chunks = []
+    lines = text.splitlines()
+    unnamed = 0
+    seen = {}
+    i = 0
+    while i < len(lines):
+        match = fence_pattern.match(lines[i])
+        if not match:
+            i += 1
+            continue
+        indent, fence, engine, rest = match.groups()
+        label, options = parse_header(rest)
+        named = label is not None
+        if not named:
+            unnamed += 1
+            label = f"unnamed-chunk-{unnamed}"
+        seen[label] = seen.get(label, 0) + 1
+        if seen[label] > 1:
+            label = f"{label}-{seen[label]}"
+        start = i
+        body = []
+        i += 1
+        while i < len(lines):
+            stripped = lines[i].strip()
+            if stripped.startswith(fence) and not stripped.strip("`"):
+                break
+            line = lines[i]
+            body.append(line[len(indent):] if line.startswith(indent) else line.lstrip())
+            i += 1
+        chunks.append({"id": label, "named": named, "engine": engine, "options": options, "line": start + 1,
+                       "code": "\n".join(body) + "\n" if body else ""})
+        i += 1
+    return chunks
+
+
+def load_index(root):
+    try:
+        with open(os.path.join(root, index_filename), encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {"version": index_version, "files": {}}
+    if index.get("version") != index_version:
+        return {"version": index_version, "files": {}}
+    return index
+
+
+def save_index(root, index):
+    path = os.path.join(root, index_filename)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def update_index(root, index):
+    """
+    Brings the index up to date with the .Rmd files under root. Returns
+    (changed, removed): the relative paths whose chunks were re-parsed, and
+    those that no longer exist.
+    """
+    files = index["files"]
+    changed = []
+    seen = set()
+    for path in render.find_rmd_files(root):
+        rel_path = os.path.relpath(path, root)
+        seen.add(rel_path)
+        st = os.stat(path)
+        entry = files.get(rel_path)
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = generate.content_hash(data)
+        if entry and entry["sha256"] == digest:
+            entry["mtime_ns"] = st.st_mtime_ns
+            continue
+        chunks = parse_chunks(data.decode("utf-8", errors="replace"))
+        for chunk in chunks:
+            chunk["sha256"] = generate.content_hash(chunk.pop("code").encode("utf-8"))
+        files[rel_path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest, "chunks": chunks}
+        changed.append(rel_path)
+        generate.logger.debug("  indexed  %s (%d chunk(s))", rel_path, len(chunks))
+    removed = sorted(set(files) - seen)
+    for rel_path in removed:
+        del files[rel_path]
+    return changed, removed
+
+
+def script_names(chunks):
+    """
+    Returns the script filename of each chunk: its label when it has one,
+    else chunk-<first 12 hex digits of its code hash>, with a -2, -3, ...
+    suffix for repeats within the lesson.
+    """
+    names, seen = [], {}
+    for chunk in chunks:
+        name = chunk["id"] if chunk["named"] else f"chunk-{chunk['sha256'][:12]}"
+        seen[name] = seen.get(name, 0) + 1
+        names.append(f"{name}-{seen[name]}.R" if seen[name] > 1 else f"{name}.R")
+    return names
+
+
+def purl_header(chunk):
+    label = chunk["id"] if chunk["named"] else ""
+    options = "".join(f", {name}={value}" for name, value in chunk["options"].items())
+    if not label:
+        options = options.lstrip(", ")
+    return f"## ----{label}{options}" + "-" * max(4, 60 - len(label) - len(options)) + "\n"
+
+
+def script_text(chunk, code):
+    # Like purl, chunks that are not evaluated are kept but commented out.
+    if chunk["options"].get("eval", "TRUE").upper() in ("FALSE", "F"):
+        code = "".join(f"# {line}\n" for line in code.splitlines())
+    return purl_header(chunk) + code
+
+
+def tangle(root, out_dir, index):
+    """
+    Writes the R chunks of the indexed lessons to <out_dir>/<lesson>/<name>.R
+    (named by script_names()), skipping chunks whose script was written from
+    the same code and options, and deletes the scripts of removed lessons
+    and chunks. Lessons are only read when one of their chunks changed.
+    Returns the counts of scripts written, left untouched and deleted.
+    """
+    stats = {"written": 0, "unchanged": 0, "deleted": 0}
+    if index.get("tangle_dir") != os.path.abspath(out_dir):
+        index["tangled"] = {}
+        index["tangle_dir"] = os.path.abspath(out_dir)
+    tangled = index["tangled"]
+    for rel_path in sorted(set(tangled) - set(index["files"])):
+        script_dir = os.path.join(out_dir, os.path.splitext(rel_path)[0])
+        stats["deleted"] += len(tangled.pop(rel_path))
+        shutil.rmtree(script_dir, ignore_errors=True)
+    for rel_path, entry in sorted(index["files"].items()):
+        script_dir = os.path.join(out_dir, os.path.splitext(rel_path)[0])
+        previous = tangled.get(rel_path, {})
+        current = {}
+        code_by_line = None
+        r_chunks = [chunk for chunk in entry["chunks"] if chunk["engine"].lower() == "r"]
+        for chunk, name in zip(r_chunks, script_names(r_chunks)):
+            state = chunk["sha256"] + json.dumps(chunk["options"], sort_keys=True)
+            current[name] = state
+            if previous.get(name) == state:
+                stats["unchanged"] += 1
+                continue
+            if code_by_line is None:
+                # The index does not keep chunk code, so the lesson is parsed once more here.
+                with open(os.path.join(root, rel_path), encoding="utf-8", errors="replace") as f:
+                    code_by_line = {c["line"]: c["code"] for c in parse_chunks(f.read())}
+            os.makedirs(script_dir, exist_ok=True)
+            with open(os.path.join(script_dir, name), "w", encoding="utf-8") as f:
+                f.write(script_text(chunk, code_by_line[chunk["line"]]))
+            stats["written"] += 1
+            generate.logger.debug("  tangled  %s", os.path.join(script_dir, name))
+        for name in set(previous) - set(current):
+            try:
+                os.remove(os.path.join(script_dir, name))
+                stats["deleted"] += 1
+            except FileNotFoundError:
+                pass
+        tangled[rel_path] = current
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index the code chunks of a course's R Markdown lessons.")
+    parser.add_argument("root", nargs="?", default=generate.base_course_dir,
+                        help=f"course tree to index (default: {generate.base_course_dir})")
+    parser.add_argument("--tangle", metavar="DIR", help="write changed R chunks to DIR/<lesson>/<chunk label or code hash>.R")
+    parser.add_argument("--list", action="store_true", help="print every indexed chunk as a JSON line")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every indexed file and written script")
+    args = parser.parse_args(argv)
+    generate.configure_logging(1 if args.verbose else 0)
+
+    index = load_index(args.root)
+    changed, removed = update_index(args.root, index)
+    generate.logger.info("Indexed %d file(s): %d re-parsed, %d removed.",
+                         len(index["files"]), len(changed), len(removed))
+    if args.tangle:
+        stats = tangle(args.root, args.tangle, index)
+        generate.logger.info("Tangled %d script(s), %d unchanged, %d deleted.",
+                             stats["written"], stats["unchanged"], stats["deleted"])
+    save_index(args.root, index)
+    if args.list:
+        generate.flush_log()
+        for rel_path, entry in sorted(index["files"].items()):
+            for chunk in entry["chunks"]:
+                sys.stdout.write(json.dumps({"lesson": rel_path, **chunk}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
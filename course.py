@@ -0,0 +1,58 @@
+import sys
+
+# One entry point for the course tools: `python course.py <command> [args]`.
+# Each command hands its arguments to the main() of the module that
+# implements it, and that module is imported only once its command is
+# chosen, so `course.py --help` (or a typo) never pays for generate.py's
+# outline, SQLite, inotify, rendering or archive support. Not even argparse
+# is imported here; `python bench.py --startup` measures the cost.
+
+# command -> (module, arguments put in front of the user's, summary)
+commands = {
+    "generate": ("generate", [], "generate the course into a directory (--output DIR, --outline PATH)"),
+    "plan": ("generate", ["--plan"], "show what generating would create, update or leave alone"),
+    "watch": ("generate", ["--watch"], "regenerate the lessons affected by each outline edit"),
+    "archive": ("generate", ["--archive"], "write the course into a .zip/.tar/.tar.gz/.tar.zst: archive FILE"),
+    "db": ("generate", ["--database"], "write the course into a SQLite database: db FILE [--fts]"),
+    "rollback": ("generate", ["--rollback"], "restore the tree replaced by the last staged build"),
+    "batch": ("batch", [], "generate one course tree per cohort overlay from a shared base"),
+    "index": ("search_index", [], "update the full-text search index, or query it: index [TERMS]"),
+    "stats": ("course_stats", [], "report words, reading time, code chunks and bullets per lesson/module/phase"),
+    "site": ("course_site", [], "build or update the static HTML site of a generated course"),
+    "render": ("render", [], "render the R Markdown documents of a course tree"),
+    "chunks": ("chunks", [], "index the code chunks of the R Markdown lessons, or tangle them"),
+    "cache": ("artifact_cache", [], "inspect or trim the rendered artifact cache"),
+    "bench": ("bench", [], "benchmark the generator on synthetic outlines"),
+}
+
+
+def usage():
+    width = max(len(name) for name in commands)
+    lines = ["usage: course.py <command> [args...]", "",
+             "Tools for building the R programming course. Run 'course.py <command> --help'",
+             "for the options of a command.", "", "commands:"]
+    lines.extend(f"  {name:<{width}}  {summary}" for name, (_, _, summary) in commands.items())
+    return "\n".join(lines) + "\n"
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        sys.stdout.write(usage())
+        return
+    name, args = argv[0], argv[1:]
+    if name not in commands:
+        sys.stderr.write(usage() + f"\ncourse.py: error: unknown command '{name}'\n")
+        sys.exit(2)
+    module_name, prefix, _ = commands[name]
+    if "-h" in args or "--help" in args:
+        # Options like --archive FILE would otherwise swallow the --help.
+        prefix = []
+    import importlib
+    module = importlib.import_module(module_name)
+    sys.argv[0] = f"course.py {name}"
+    module.main(prefix + args)
+
+
+if __name__ == "__main__":
+    main()
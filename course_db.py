@@ -0,0 +1,187 @@
+import sqlite3
+
+import generate
+
+# Writes the course into a SQLite database for consumers that read it from
+# there rather than from files. Phases, modules and lessons become rows keyed
+# by their names, with a content hash per lesson and a combined hash per
+# module and phase (the same hashes as the generator's manifest).
+#
+# Everything happens in one transaction. The stored hashes and positions are
+# read first, so a rerun only inserts new rows, updates the rows whose
+# content or position changed and deletes the rows that left the outline,
+# each group with one executemany over a prepared statement. With fts=True
+# the lesson bodies are also kept in an FTS5 table, updated for the same
+# changed rows only.
+
+schema = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS phases (
+    phase TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS modules (
+    phase TEXT NOT NULL,
+    module TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (phase, module)
+);
+CREATE TABLE IF NOT EXISTS lessons (
+    id INTEGER PRIMARY KEY,
+    phase TEXT NOT NULL,
+    module TEXT NOT NULL,
+    lesson TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    UNIQUE (phase, module, lesson)
+);
+"""
+
+# An external-content FTS5 index over lessons.body, kept in step by
+# triggers, so it is touched only for the rows a run inserts, updates or
+# deletes. It is keyed on the explicit lessons.id: an implicit rowid may be
+# renumbered by VACUUM, which would desync the index.
+fts_schema = """
+CREATE VIRTUAL TABLE lessons_fts USING fts5(body, content='lessons', content_rowid='id');
+CREATE TRIGGER lessons_fts_insert AFTER INSERT ON lessons BEGIN
+    INSERT INTO lessons_fts (rowid, body) VALUES (new.id, new.body);
+END;
+CREATE TRIGGER lessons_fts_delete AFTER DELETE ON lessons BEGIN
+    INSERT INTO lessons_fts (lessons_fts, rowid, body) VALUES ('delete', old.id, old.body);
+END;
+CREATE TRIGGER lessons_fts_update AFTER UPDATE OF body ON lessons BEGIN
+    INSERT INTO lessons_fts (lessons_fts, rowid, body) VALUES ('delete', old.id, old.body);
+    INSERT INTO lessons_fts (rowid, body) VALUES (new.id, new.body);
+END;
+INSERT INTO lessons_fts (lessons_fts) VALUES ('rebuild');
+"""
+
+# table -> (key columns, other columns), for sync_rows()
+tables = {
+    "phases": (("phase",), ("position", "sha256")),
+    "modules": (("phase", "module"), ("position", "sha256")),
+    "lessons": (("phase", "module", "lesson"), ("position", "sha256", "size", "body")),
+}
+
+
+def sync_rows(conn, table, rows, compare):
+    """
+    Makes `table` hold exactly `rows` ({key tuple: value tuple}). Existing rows
+    are compared on the `compare` values only (e.g. the hash and position,
+    not the body); rows whose only difference is their position get a
+    position-only update, so shifting lessons does not rewrite their bodies.
+    Returns (inserted, updated, deleted) key lists.
+    """
+    keys, columns = tables[table]
+    existing = {row[:len(keys)]: row[len(keys):] for row in
+                conn.execute(f"SELECT {', '.join(keys + compare)} FROM {table}")}
+    positions = [columns.index(name) for name in compare]
+    inserted, updated, moved = [], [], []
+    for key, values in rows.items():
+        old = existing.get(key)
+        if old is None:
+            inserted.append(key)
+        elif old != tuple(values[i] for i in positions):
+            if old[1:] == tuple(values[i] for i in positions[1:]):
+                moved.append(key)
+            else:
+                updated.append(key)
+    deleted = [key for key in existing if key not in rows]
+
+    placeholders = ", ".join("?" * (len(keys) + len(columns)))
+    conn.executemany(f"INSERT INTO {table} ({', '.join(keys + columns)}) VALUES ({placeholders})",
+                     (key + rows[key] for key in inserted))
+    where = " AND ".join(f"{name} = ?" for name in keys)
+    assignments = ", ".join(f"{name} = ?" for name in columns)
+    conn.executemany(f"UPDATE {table} SET {assignments} WHERE {where}",
+                     (rows[key] + key for key in updated))
+    conn.executemany(f"UPDATE {table} SET position = ? WHERE {where}",
+                     ((rows[key][0],) + key for key in moved))
+    conn.executemany(f"DELETE FROM {table} WHERE {where}", deleted)
+    return inserted, updated + moved, deleted
+
+
+def create_course_database(db_path, outline, fts=False):
+    """
+    Writes the outline (a dict, a compiled outline or a stream of records, as
+    for create_course_materials) into the SQLite database at db_path, creating
+    it if needed. Returns {"phases", "modules", "lessons"} counts of inserted,
+    updated, unchanged and deleted rows.
+    """
+    # Positions count within the parent (a lesson's index in its module, a
+    # module's in its phase), so adding a lesson only moves its own siblings.
+    phase_modules, modules, lessons = {}, {}, {}
+    module_lessons = {}
+    for lesson in generate.outline_entries(outline):
+        module = lesson.module
+        data = lesson.content.encode("utf-8")
+        digest = generate.content_hash(data)
+        if (module.phase, module.name) not in module_lessons:
+            module_lessons[(module.phase, module.name)] = []
+            phase_modules.setdefault(module.phase, []).append(module.name)
+        siblings = module_lessons[(module.phase, module.name)]
+        lessons[(module.phase, module.name, lesson.filename)] = (len(siblings), digest, len(data), lesson.content)
+        siblings.append((lesson.filename, digest))
+    module_hashes = {key: generate.combined_hash(items) for key, items in module_lessons.items()}
+    for phase_name, module_names in phase_modules.items():
+        for position, module_name in enumerate(module_names):
+            modules[(phase_name, module_name)] = (position, module_hashes[(phase_name, module_name)])
+    phases = {(phase_name,): (position, generate.combined_hash(
+                  (module_name, module_hashes[(phase_name, module_name)]) for module_name in module_names))
+              for position, (phase_name, module_names) in enumerate(phase_modules.items())}
+
+    # Transactions are managed explicitly so the schema changes share the one transaction too.
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        has_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'lessons_fts'").fetchone()
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(lessons)")]
+        upgrade = ""
+        if columns and "id" not in columns:
+            # Made before lessons had an id: rebuild the table (and its index) and refill it below.
+            upgrade = "DROP TABLE IF EXISTS lessons_fts;\nDROP TABLE lessons;\n"
+            fts = fts or has_fts
+            has_fts = None
+        try:
+            conn.executescript("BEGIN;\n" + upgrade + schema + (fts_schema if fts and not has_fts else ""))
+        except sqlite3.OperationalError as error:
+            raise generate.CourseGenerationError([(db_path, error)]) from error
+        conn.execute("INSERT INTO meta (key, value) VALUES ('readme', ?) "
+                     "ON CONFLICT (key) DO UPDATE SET value = excluded.value WHERE value != excluded.value",
+                     (generate.course_readme,))
+        summary = {}
+        for table, rows in (("phases", phases), ("modules", modules), ("lessons", lessons)):
+            # position first: sync_rows relies on it to spot moves
+            inserted, updated, deleted = sync_rows(conn, table, rows, ("position", "sha256"))
+            summary[table] = {"inserted": len(inserted), "updated": len(updated), "deleted": len(deleted),
+                              "unchanged": len(rows) - len(inserted) - len(updated)}
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    for table, counts in summary.items():
+        generate.logger.info("  %-8s %d inserted, %d updated, %d unchanged, %d deleted", table,
+                             counts["inserted"], counts["updated"], counts["unchanged"], counts["deleted"])
+    generate.logger.info("Course database complete! ('%s')", db_path)
+    return summary
+
+
+def search(db_path, query, limit=20):
+    """Returns (phase, module, lesson, snippet) rows matching an FTS5 query, best first."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(
+            "SELECT lessons.phase, lessons.module, lessons.lesson, snippet(lessons_fts, 0, '[', ']', '...', 12) "
+            "FROM lessons_fts JOIN lessons ON lessons.id = lessons_fts.rowid "
+            "WHERE lessons_fts MATCH ? ORDER BY rank LIMIT ?", (query, limit)).fetchall()
+    finally:
+        conn.close()
@@ -0,0 +1,379 @@
+import argparse
+import html
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import generate
+
+# Builds a static HTML site from a generated course: one page per lesson,
+# with links to the previous and next lesson in course order, plus an index
+# page for the course, each phase and each module.
+#
+# The structure comes from the generator's manifest (see
+# course_stats.find_lessons), so lessons are taken in natural course order
+# and their content hashes are known without reading them. Every lesson
+# page has a key made of its lesson's hash, its title and the paths and
+# titles of its neighbours; a page is rendered again only when that key
+# differs from the one recorded by the last build, so editing one lesson
+# re-renders it and the two pages linking to it, and nothing else. Titles are
+# cached per content hash, so unchanged lessons are not even opened. Pages
+# that need rendering are converted on a process pool; the index pages are
+# derived from the already computed navigation in the main process, once per
+# build, and written only when their HTML changed.
+#
+# Markdown is converted with the markdown package when it is installed, and
+# otherwise with simple_markdown(), which covers what the lessons use:
+# headings, paragraphs, bullet and numbered lists, fenced code and inline
+# code, emphasis and links.
+
+state_filename = ".site_state.json"
+state_version = 1
+template_version = 1
+default_site_dir = "site"
+# Fewer pages than this are rendered in-process; a pool would cost more to start.
+parallel_threshold = 32
+
+page_template = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+</head>
+<body>
+<nav class="breadcrumbs">{breadcrumbs}</nav>
+<main>
+{body}
+</main>
+<nav class="pager">{pager}</nav>
+</body>
+</html>
+"""
+
+title_pattern = re.compile(r"^#\s+(.+?)\s*#*\s*$")
+fence_pattern = re.compile(r"^\s*(```|~~~)")
+heading_pattern = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+bullet_pattern = re.compile(r"^\s*[*+-]\s+(.*)$")
+ordered_pattern = re.compile(r"^\s*\d+[.)]\s+(.*)$")
+link_pattern = re.compile(r"\[([^\]]+)\]\(([^)\s]+)\)")
+strong_pattern = re.compile(r"(\*\*|__)(.+?)\1")
+em_pattern = re.compile(r"(?<![*\w])([*_])(?!\s)(.+?)(?<!\s)\1(?![*\w])")
+
+
+def renderer_name():
+    """Names the Markdown converter in use; part of every page key, so switching converters re-renders."""
+    try:
+        import markdown
+    except ImportError:
+        return "builtin"
+    return f"markdown {markdown.__version__}"
+
+
+def render_markdown(text):
+    try:
+        import markdown
+    except ImportError:
+        return simple_markdown(text)
+    return markdown.markdown(text, extensions=["fenced_code"])
+
+
+def inline_markdown(text):
+    """Converts code spans, emphasis and links in one line of text, escaping the rest."""
+    parts = text.split("`")
+    if len(parts) % 2 == 0:
+        # An unmatched backtick stays a literal one.
+        parts[-2:] = [parts[-2] + "`" + parts[-1]]
+    for i, part in enumerate(parts):
+        if i % 2:
+            parts[i] = f"<code>{html.escape(part)}</code>"
+            continue
+        part = html.escape(part, quote=False)
+        part = link_pattern.sub(lambda m: f'<a href="{html.escape(m.group(2))}">{m.group(1)}</a>', part)
+        part = strong_pattern.sub(r"<strong>\2</strong>", part)
+        parts[i] = em_pattern.sub(r"<em>\2</em>", part)
+    return "".join(parts)
+
+
+def simple_markdown(text):
+    """A small Markdown to HTML converter for the subset of Markdown the lessons use."""
+    out = []
+    paragraph = []
+    list_tag = None
+    fence = None
+    code = []
+
+    def close_blocks():
+        nonlocal list_tag
+        if paragraph:
+            out.append(f"<p>{inline_markdown(' '.join(line.strip() for line in paragraph))}</p>")
+            paragraph.clear()
+        if list_tag:
+            out.append(f"</{list_tag}>")
+            list_tag = None
+
+    for line in text.splitlines():
+        if fence is not None:
+            if line.strip().startswith(fence):
+                out.append(f"<pre><code>{html.escape(chr(10).join(code))}</code></pre>")
+                fence = None
+                code = []
+            else:
+                code.append(line)
+            continue
+        match = fence_pattern.match(line)
+        if match:
+            close_blocks()
+            fence = match.group(1)
+            continue
+        match = heading_pattern.match(line)
+        if match:
+            close_blocks()
+            level = len(match.group(1))
+            out.append(f"<h{level}>{inline_markdown(match.group(2))}</h{level}>")
+            continue
+        item, tag = None, None
+        match = bullet_pattern.match(line)
+        if match:
+            item, tag = match.group(1), "ul"
+        else:
+            match = ordered_pattern.match(line)
+            if match:
+                item, tag = match.group(1), "ol"
+        if item is not None:
+            if paragraph or list_tag != tag:
+                close_blocks()
+                out.append(f"<{tag}>")
+                list_tag = tag
+            out.append(f"<li>{inline_markdown(item)}</li>")
+            continue
+        if not line.strip():
+            close_blocks()
+        elif list_tag and line.startswith((" ", "\t")):
+            out[-1] = out[-1][:-len("</li>")] + " " + inline_markdown(line.strip()) + "</li>"
+        else:
+            if list_tag:
+                close_blocks()
+            paragraph.append(line)
+    if fence is not None:
+        out.append(f"<pre><code>{html.escape(chr(10).join(code))}</code></pre>")
+    close_blocks()
+    return "\n".join(out)
+
+
+def lesson_title(text, lesson_filename):
+    """The lesson's first level-one heading, else a title made from its file name."""
+    for line in text.splitlines():
+        match = title_pattern.match(line)
+        if match:
+            return match.group(1)
+    return display_name(os.path.splitext(lesson_filename)[0])
+
+
+def display_name(name):
+    """Phase_1_Introduction_to_R -> Phase 1 Introduction to R."""
+    return name.replace("_", " ")
+
+
+def page_path(rel_path):
+    """The site path of a lesson page: the lesson's path with .html for .md."""
+    return os.path.splitext(rel_path)[0] + ".html"
+
+
+def link(from_page, to_page, text):
+    href = os.path.relpath(to_page, os.path.dirname(from_page) or ".").replace(os.sep, "/")
+    return f'<a href="{html.escape(href)}">{html.escape(text)}</a>'
+
+
+def breadcrumbs(page, phase_name=None, module_name=None):
+    crumbs = [link(page, "index.html", "Course")]
+    if phase_name:
+        crumbs.append(link(page, f"{phase_name}/index.html", display_name(phase_name)))
+    if module_name:
+        crumbs.append(link(page, f"{phase_name}/{module_name}/index.html", display_name(module_name)))
+    return " &rsaquo; ".join(crumbs)
+
+
+def render_page(task):
+    """
+    Renders one lesson page. Runs in a worker process, so it takes and
+    returns plain data: (source path, page path, title, breadcrumbs, pager).
+    """
+    src_path, out_path, title, crumbs, pager = task
+    with open(src_path, encoding="utf-8", errors="replace") as f:
+        body = render_markdown(f.read())
+    write_page(out_path, page_template.format(title=html.escape(title), breadcrumbs=crumbs, body=body,
+                                              pager=pager))
+
+
+def write_page(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(path + ".tmp", path)
+
+
+def load_state(site_dir):
+    try:
+        with open(os.path.join(site_dir, state_filename), encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    if not isinstance(state, dict) or state.get("version") != state_version:
+        state = {}
+    return {"version": state_version, "pages": state.get("pages", {}), "titles": state.get("titles", {})}
+
+
+def save_state(site_dir, state):
+    path = os.path.join(site_dir, state_filename)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, separators=(",", ":"), sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def index_pages(lessons, titles):
+    """
+    Returns {page path: HTML} for the course, phase and module index pages,
+    from the (rel_path, ...) lessons in course order and their titles.
+    """
+    tree = {}
+    for rel_path, *_ in lessons:
+        phase_name, module_name, _ = rel_path.split("/")
+        tree.setdefault(phase_name, {}).setdefault(module_name, []).append(rel_path)
+
+    def page(path, title, crumbs, items):
+        body = f"<h1>{html.escape(title)}</h1>\n<ul>\n" + "\n".join(f"<li>{item}</li>" for item in items) + "\n</ul>"
+        return page_template.format(title=html.escape(title), breadcrumbs=crumbs, body=body, pager="")
+
+    pages = {"index.html": page("index.html", "Course", breadcrumbs("index.html"),
+                                [link("index.html", f"{phase_name}/index.html", display_name(phase_name))
+                                 for phase_name in tree])}
+    for phase_name, modules in tree.items():
+        path = f"{phase_name}/index.html"
+        pages[path] = page(path, display_name(phase_name), breadcrumbs(path, phase_name),
+                           [link(path, f"{phase_name}/{module_name}/index.html", display_name(module_name))
+                            for module_name in modules])
+        for module_name, rel_paths in modules.items():
+            path = f"{phase_name}/{module_name}/index.html"
+            pages[path] = page(path, display_name(module_name), breadcrumbs(path, phase_name, module_name),
+                               [link(path, page_path(rel_path), titles[rel_path]) for rel_path in rel_paths])
+    return pages
+
+
+def build_site(root, site_dir, jobs=None, force=False):
+    """
+    Brings the HTML site for the course under root up to date in site_dir.
+    Returns {"rendered", "unchanged", "indexes_written", "removed"} counts.
+    """
+    import course_stats
+    lessons = course_stats.find_lessons(root)
+    state = {"version": state_version, "pages": {}, "titles": {}} if force else load_state(site_dir)
+    renderer = renderer_name()
+
+    # Titles, from the cache where the content hash is known.
+    titles, title_cache = {}, {}
+    for i, (rel_path, digest, _) in enumerate(lessons):
+        title = state["titles"].get(digest) if digest else None
+        if title is None:
+            with open(os.path.join(root, rel_path), "rb") as f:
+                data = f.read()
+            digest = generate.content_hash(data)
+            lessons[i] = (rel_path, digest, len(data))
+            title = state["titles"].get(digest) or lesson_title(data.decode("utf-8", errors="replace"),
+                                                                os.path.basename(rel_path))
+        titles[rel_path] = title_cache[digest] = title
+
+    pages, tasks = {}, []
+    counts = {"rendered": 0, "unchanged": 0, "indexes_written": 0, "removed": 0}
+    for i, (rel_path, digest, _) in enumerate(lessons):
+        path = page_path(rel_path)
+        phase_name, module_name, _ = rel_path.split("/")
+        neighbours = [lessons[j][0] if 0 <= j < len(lessons) else None for j in (i - 1, i + 1)]
+        key = generate.content_hash(json.dumps(
+            [template_version, renderer, digest, titles[rel_path]]
+            + [[page_path(n), titles[n]] if n else None for n in neighbours]).encode("utf-8"))
+        pages[path] = key
+        if state["pages"].get(path) == key and os.path.exists(os.path.join(site_dir, path)):
+            counts["unchanged"] += 1
+            continue
+        pager = " ".join(f'<span class="{rel}">{label} {link(path, page_path(n), titles[n])}</span>'
+                         for (rel, label), n in zip((("prev", "&larr;"), ("next", "&rarr;")), neighbours) if n)
+        tasks.append((os.path.join(root, rel_path), os.path.join(site_dir, path), titles[rel_path],
+                      breadcrumbs(path, phase_name, module_name), pager))
+
+    errors = []
+    if jobs == 1 or len(tasks) < parallel_threshold:
+        for task in tasks:
+            try:
+                render_page(task)
+            except OSError as error:
+                errors.append((task[1], error))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [(task, pool.submit(render_page, task)) for task in tasks]
+            for task, future in futures:
+                try:
+                    future.result()
+                except OSError as error:
+                    errors.append((task[1], error))
+    failed = {os.path.relpath(path, site_dir) for path, _ in errors}
+    for _, out_path, *_ in tasks:
+        rel = os.path.relpath(out_path, site_dir).replace(os.sep, "/")
+        if rel in failed:
+            # Keep the last good page published, under its old key so the next build retries it.
+            if rel in state["pages"]:
+                pages[rel] = state["pages"][rel]
+            else:
+                del pages[rel]
+        else:
+            counts["rendered"] += 1
+            generate.logger.debug("  rendered %s", rel)
+
+    for path, text in index_pages(lessons, titles).items():
+        key = generate.content_hash(text.encode("utf-8"))
+        pages[path] = key
+        if state["pages"].get(path) == key and os.path.exists(os.path.join(site_dir, path)):
+            continue
+        write_page(os.path.join(site_dir, path), text)
+        counts["indexes_written"] += 1
+
+    stale = sorted(set(state["pages"]) - set(pages))
+    generate.remove_orphans(site_dir, stale)
+    counts["removed"] = len(stale)
+    os.makedirs(site_dir, exist_ok=True)
+    save_state(site_dir, {"version": state_version, "pages": pages, "titles": title_cache})
+    if errors:
+        raise generate.CourseGenerationError(errors)
+    generate.logger.info("Site: %d page(s) rendered, %d unchanged, %d index page(s) written, %d removed "
+                         "('%s', %s).", counts["rendered"], counts["unchanged"], counts["indexes_written"],
+                         counts["removed"], site_dir, renderer)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or update the static HTML site of a generated course.")
+    parser.add_argument("root", nargs="?", default=generate.base_course_dir,
+                        help=f"course tree to publish (default: {generate.base_course_dir})")
+    parser.add_argument("-o", "--output", default=default_site_dir,
+                        help=f"directory to build the site in (default: {default_site_dir})")
+    parser.add_argument("-j", "--jobs", type=int, help="number of rendering processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="render every page, ignoring the last build")
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument("-q", "--quiet", action="store_const", dest="verbosity", const=-1, default=0,
+                           help="only report warnings and errors")
+    verbosity.add_argument("-v", "--verbose", action="store_const", dest="verbosity", const=1,
+                           help="report every rendered page")
+    args = parser.parse_args(argv)
+    generate.configure_logging(args.verbosity)
+    if not os.path.isdir(args.root):
+        parser.exit(1, f"error: no course tree at '{args.root}'\n")
+    try:
+        build_site(args.root, args.output, jobs=args.jobs, force=args.force)
+    except (OSError, generate.CourseGenerationError) as error:
+        generate.flush_log()
+        parser.exit(1, f"error: {error}\n")
+
+
+if __name__ == "__main__":
+    main()
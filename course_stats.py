@@ -0,0 +1,265 @@
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+from array import array
+
+import generate
+
+# Corpus statistics for a generated course: per lesson the number of prose
+# words, the estimated reading time, the number of fenced code chunks and
+# code lines, and the number of bullet points, plus totals per module, per
+# phase and for the whole course.
+#
+# Lessons are found through the generator's manifest, which already holds
+# each lesson's content hash, and metrics are cached per hash in a side file,
+# so a rerun reads only the lessons whose content is new; the rest cost one
+# stat each. Without a manifest every .md lesson is read and hashed. Each
+# metric is kept as one column (an array of integers, lessons grouped by
+# module in course order), and the module totals are one segmented sum per
+# column: numpy.add.reduceat when NumPy is installed, slices of the arrays
+# otherwise.
+
+cache_filename = ".course_stats.json"
+cache_version = 1
+metric_names = ("words", "code_chunks", "code_lines", "bullets")
+report_columns = ("level", "phase", "module", "lesson", "lessons", "words", "reading_minutes",
+                  "code_chunks", "code_lines", "bullets")
+words_per_minute = 200
+
+word_pattern = re.compile(r"[A-Za-z0-9]+(?:['’-][A-Za-z0-9]+)*")
+fence_pattern = re.compile(r"^\s*(```|~~~)")
+bullet_pattern = re.compile(r"^\s*(?:[*+-]|\d+[.)])\s+\S")
+heading_pattern = re.compile(r"^\s*#+\s*")
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def lesson_metrics(text):
+    """Returns (words, code chunks, code lines, bullets) for a lesson body."""
+    words = code_chunks = code_lines = bullets = 0
+    fence = None
+    for line in text.splitlines():
+        match = fence_pattern.match(line)
+        if match:
+            if fence is None:
+                fence = match.group(1)
+                code_chunks += 1
+            elif match.group(1) == fence:
+                fence = None
+            continue
+        if fence is not None:
+            if line.strip():
+                code_lines += 1
+            continue
+        if bullet_pattern.match(line):
+            bullets += 1
+        words += len(word_pattern.findall(heading_pattern.sub("", line)))
+    return words, code_chunks, code_lines, bullets
+
+
+def find_lessons(root):
+    """
+    Returns [(rel_path, sha256 or None, size or None)] for the lessons under
+    root: the .md files two folders down (<phase>/<module>/<lesson>.md), in
+    natural order. Hashes and sizes come from the manifest when there is one.
+    """
+    from outline_io import natural_key
+    manifest = generate.load_manifest(root)
+    if manifest["files"]:
+        lessons = [(rel_path, entry["sha256"], entry["size"]) for rel_path, entry in manifest["files"].items()
+                   if rel_path.count("/") == 2 and rel_path.endswith(".md")]
+    else:
+        lessons = []
+        for phase in os.scandir(root):
+            if not phase.is_dir() or phase.name.startswith("."):
+                continue
+            for module in os.scandir(phase.path):
+                if not module.is_dir() or module.name.startswith("."):
+                    continue
+                lessons.extend((f"{phase.name}/{module.name}/{entry.name}", None, None)
+                               for entry in os.scandir(module.path)
+                               if entry.is_file() and entry.name.endswith(".md") and not entry.name.startswith("."))
+    lessons.sort(key=lambda lesson: [natural_key(part) for part in lesson[0].split("/")])
+    return lessons
+
+
+def load_cache(root):
+    try:
+        with open(os.path.join(root, cache_filename), encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get("version") != cache_version:
+        return {}
+    return cache.get("metrics", {})
+
+
+def save_cache(root, metrics):
+    path = os.path.join(root, cache_filename)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"version": cache_version, "metrics": metrics}, f, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+
+class CorpusStats:
+    """
+    Per-lesson metrics as columns. `paths` holds the lessons' relative paths
+    and `columns` one array per name in metric_names, in the same order;
+    `modules` lists (phase, module, index of its first lesson), so each
+    module's lessons are one contiguous slice of every column.
+    """
+
+    def __init__(self):
+        self.paths = []
+        self.modules = []
+        self.columns = {name: array("I") for name in metric_names}
+
+    def __len__(self):
+        return len(self.paths)
+
+    def add(self, rel_path, metrics):
+        phase_name, module_name, _ = rel_path.split("/")
+        if not self.modules or self.modules[-1][:2] != (phase_name, module_name):
+            self.modules.append((phase_name, module_name, len(self.paths)))
+        self.paths.append(rel_path)
+        for name, value in zip(metric_names, metrics):
+            self.columns[name].append(value)
+
+    def module_totals(self):
+        """Returns {metric: sequence of per-module sums}, in the order of self.modules."""
+        starts = [start for _, _, start in self.modules]
+        np = _numpy()
+        if np is not None and starts:
+            return {name: np.add.reduceat(np.frombuffer(column, dtype=np.uint32).astype(np.int64), starts).tolist()
+                    for name, column in self.columns.items()}
+        bounds = list(zip(starts, starts[1:] + [len(self.paths)]))
+        return {name: [sum(column[start:end]) for start, end in bounds] for name, column in self.columns.items()}
+
+    def report(self):
+        """
+        Returns the report rows: one per lesson, module and phase, then the
+        course total, each a dict with the keys in report_columns.
+        """
+        def row(level, phase_name, module_name, lesson_filename, lessons, values):
+            values = dict(zip(metric_names, values))
+            return {"level": level, "phase": phase_name, "module": module_name, "lesson": lesson_filename,
+                    "lessons": lessons, "words": values["words"],
+                    "reading_minutes": round(values["words"] / words_per_minute, 1),
+                    "code_chunks": values["code_chunks"], "code_lines": values["code_lines"],
+                    "bullets": values["bullets"]}
+
+        rows = []
+        for i, rel_path in enumerate(self.paths):
+            phase_name, module_name, lesson_filename = rel_path.split("/")
+            rows.append(row("lesson", phase_name, module_name, lesson_filename, 1,
+                            [self.columns[name][i] for name in metric_names]))
+        totals = self.module_totals()
+        ends = [start for _, _, start in self.modules[1:]] + [len(self.paths)]
+        phases = {}
+        for i, ((phase_name, module_name, start), end) in enumerate(zip(self.modules, ends)):
+            values = [totals[name][i] for name in metric_names]
+            rows.append(row("module", phase_name, module_name, "", end - start, values))
+            phase = phases.setdefault(phase_name, [0] * (len(metric_names) + 1))
+            phase[0] += end - start
+            for j, value in enumerate(values, 1):
+                phase[j] += value
+        for phase_name, (lessons, *values) in phases.items():
+            rows.append(row("phase", phase_name, "", "", lessons, values))
+        rows.append(row("course", "", "", "", len(self.paths),
+                        [sum(self.columns[name]) for name in metric_names]))
+        return rows
+
+
+def collect_stats(root):
+    """
+    Computes the metrics of every lesson under root, reading only the
+    lessons whose content hash is not in the cache, and updates the cache.
+    Returns (CorpusStats, {"computed", "cached"}).
+    """
+    cache = load_cache(root)
+    stats = CorpusStats()
+    counts = {"computed": 0, "cached": 0}
+    used = {}
+    for rel_path, digest, size in find_lessons(root):
+        path = os.path.join(root, rel_path)
+        if digest is not None and digest in cache:
+            try:
+                fresh = os.stat(path).st_size == size
+            except FileNotFoundError:
+                continue
+            if fresh:
+                used[digest] = metrics = cache[digest]
+                stats.add(rel_path, metrics)
+                counts["cached"] += 1
+                continue
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            continue
+        digest = generate.content_hash(data)
+        metrics = cache.get(digest) or list(lesson_metrics(data.decode("utf-8", errors="replace")))
+        used[digest] = metrics
+        stats.add(rel_path, metrics)
+        counts["computed"] += 1
+    if used != cache:
+        save_cache(root, used)
+    generate.logger.info("Course statistics: %d lesson(s) measured, %d from the cache.",
+                         counts["computed"], counts["cached"])
+    return stats, counts
+
+
+def write_report(path, rows):
+    """Writes the report rows as JSON when path ends in .json, else as CSV."""
+    with open(path + ".tmp", "w", encoding="utf-8", newline="") as f:
+        if path.endswith(".json"):
+            report = {level + "s": [{key: value for key, value in row.items() if key != "level"}
+                                    for row in rows if row["level"] == level]
+                      for level in ("lesson", "module", "phase")}
+            report["course"] = next(row for row in rows if row["level"] == "course")
+            del report["course"]["level"]
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        else:
+            writer = csv.DictWriter(f, fieldnames=report_columns)
+            writer.writeheader()
+            writer.writerows(rows)
+    os.replace(path + ".tmp", path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report word counts, reading time, code chunks and bullets "
+                                                 "per lesson, module and phase of a generated course.")
+    parser.add_argument("root", nargs="?", default=generate.base_course_dir,
+                        help=f"course tree to measure (default: {generate.base_course_dir})")
+    parser.add_argument("-o", "--output", metavar="FILE",
+                        help="write the report to FILE, as JSON for a .json name and CSV otherwise "
+                             "(default: a module and phase summary on stdout)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only report warnings and errors")
+    args = parser.parse_args(argv)
+    generate.configure_logging(-1 if args.quiet else 0)
+    if not os.path.isdir(args.root):
+        parser.exit(1, f"error: no course tree at '{args.root}'\n")
+    stats, _ = collect_stats(args.root)
+    rows = stats.report()
+    if args.output:
+        write_report(args.output, rows)
+        generate.logger.info("Wrote statistics for %d lesson(s) to '%s'.", len(stats), args.output)
+        return
+    generate.flush_log()
+    writer = csv.DictWriter(sys.stdout, fieldnames=report_columns, lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(row for row in rows if row["level"] != "lesson")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,30 @@
 
+import argparse
+import atexit
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import logging
 import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("generate")
+
+# Run as a script, this module is __main__; register it under its own name
+# too, so `import generate` in course_db, watcher and the rest shares its
+# classes (CompiledOutline, CourseGenerationError) instead of loading a copy.
+if __name__ == "__main__":
+    sys.modules.setdefault("generate", sys.modules[__name__])
 
 # Define the base directory name for the course
 base_course_dir = "Comprehensive_R_Programming_Course"
@@ -645,16 +670,8 @@ course_outline = {
     }
 }
 
-def create_course_materials(base_dir, outline):
-    """
-    Creates directories (phases, then modules) and Markdown lesson files
-    based on the provided course outline.
-    """
-    os.makedirs(base_dir, exist_ok=True)
-    print(f"Created base directory: {base_dir}")
-
-    # Create the top-level README.md (introduction)
-    readme_content = """# Welcome to the Comprehensive R Programming Course!
+# The top-level README.md (introduction) written alongside the phases.
+course_readme = """# Welcome to the Comprehensive R Programming Course!
 
 ## Unlocking the Power of Data with R
 
@@ -683,28 +700,1569 @@ Happy coding!
 **[Your GitHub Username/Name]**
 [Link to your GitHub Profile - Optional, but good for branding]
 """
-    with open(os.path.join(base_dir, "README.md"), "w") as f:
-        f.write(readme_content)
-    print("Created info.md in the base directory.")
 
-    for phase_name, modules_dict in outline.items():
-        phase_path = os.path.join(base_dir, phase_name)
-        os.makedirs(phase_path, exist_ok=True)
-        print(f"  Created phase directory: {phase_path}")
+# Formats a build can emit: the Markdown lessons ("md", always), an R
+# Markdown twin of every lesson ("rmd") and an RStudio project per module
+# ("rproj"). The twins and the project go in the module's practice folder.
+output_formats = ("md", "rmd", "rproj")
+rmd_header = b"---\noutput:\n  pdf_document: default\n  html_document: default\n---\n"
+rproj_file = b"""Version: 1.0
+
+RestoreWorkspace: Default
+SaveWorkspace: Default
+AlwaysSaveHistory: Default
+
+EnableCodeIndexing: Yes
+UseSpacesForTab: Yes
+NumSpacesForTab: 2
+Encoding: UTF-8
+
+RnwWeave: Sweave
+LaTeX: pdfLaTeX
+"""
+
+# Name of the manifest recording the content hash of every generated file,
+# plus a combined hash per module and per phase, for incremental runs.
+manifest_filename = ".course_manifest.json"
+
+# A staged build keeps the tree it replaced next to it under this suffix.
+previous_suffix = ".previous"
+
+# Append-only record of the files a direct build has finished, for resuming
+# it after a crash; deleted once the build completes. See Journal.
+journal_filename = ".course_journal"
+
+# Default content-addressed blob store of dedup builds, inside the output tree.
+blob_dirname = ".blobs"
+
+# ioctl request cloning one file's extents into another (Linux FICLONE).
+FICLONE = 0x40049409
+
+
+def content_hash(data):
+    """Returns the SHA-256 hex digest of the given bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def combined_hash(items):
+    """Returns a single digest for an ordered sequence of (name, digest) pairs."""
+    h = hashlib.sha256()
+    for name, digest in items:
+        h.update(name.encode("utf-8"))
+        h.update(b"\0")
+        h.update(digest.encode("ascii"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def load_manifest(base_dir, backend=None):
+    """
+    Reads the manifest from a previous run. A missing or unreadable manifest
+    yields an empty one, which makes every file look new.
+    """
+    path = os.path.join(base_dir, manifest_filename)
+    try:
+        manifest = json.loads((backend or disk_backend).read(path))
+    except (OSError, ValueError):
+        manifest = {}
+    for key in ("files", "modules", "phases"):
+        if not isinstance(manifest.get(key), dict):
+            manifest[key] = {}
+    return manifest
+
+
+def save_manifest(base_dir, manifest, backend=None):
+    """Writes the manifest atomically so an interrupted run never leaves it half-written."""
+    backend = backend or disk_backend
+    path = os.path.join(base_dir, manifest_filename)
+    tmp_path = path + ".tmp"
+    with backend.open_write(tmp_path) as f:
+        f.write(json.dumps(manifest, indent=1, sort_keys=True).encode("utf-8") + b"\n")
+    backend.replace(tmp_path, path)
+
+
+def is_unchanged(path, rel_path, digest, size, manifest, backend=None):
+    """
+    A file is unchanged when the previous run recorded the same content hash
+    and the file is still on disk with the expected size.
+    """
+    if manifest["files"].get(rel_path, {}).get("sha256") != digest:
+        return False
+    return (backend or disk_backend).size(path) == size
+
+
+def load_journal(path):
+    """
+    Reads the journal of an interrupted run into {"files": {rel_path: (sha256,
+    size)}, "modules": {module_key: sha256}}. A missing journal is empty; a
+    torn last line is ignored.
+    """
+    done = {"files": {}, "modules": {}}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if "file" in entry:
+                    done["files"][entry["file"]] = (entry["sha256"], entry["size"])
+                elif "module" in entry:
+                    done["modules"][entry["module"]] = entry["sha256"]
+    except FileNotFoundError:
+        pass
+    return done
+
+
+class Journal:
+    """
+    Write-ahead log of a build's progress: one JSON line per finished file
+    (path, content hash, size), and one per module once all of its files are
+    done, with module_hash() of them. A line is appended only after its file
+    is closed, and the log is flushed at module boundaries, so after a crash
+    it may lag the tree but never runs ahead of it. A module with a failed
+    file gets no line. With resume=True the previous log is loaded and
+    extended: a module whose files all hash as they did then is finished as
+    a whole, without touching the disk, and any other file the log lists
+    with the hash and size about to be written is done once a stat confirms
+    its size.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.done = load_journal(path) if resume else {"files": {}, "modules": {}}
+        self.f = open(path, "a" if resume else "w", encoding="utf-8")
+        self.module_key = None
+        self.module_ok = True
+        self.file_hashes = []
+
+    @staticmethod
+    def module_hash(module_key, files):
+        """Combines the (rel_path, sha256) of every file of a module, lessons and extras alike."""
+        start = len(module_key) + 1
+        return combined_hash((rel_path[start:], digest) for rel_path, digest in files)
+
+    def is_done(self, rel_path, digest, size):
+        return self.done["files"].get(rel_path) == (digest, size)
+
+    def is_module_done(self, module_key, files):
+        digest = self.done["modules"].get(module_key)
+        return digest is not None and digest == self.module_hash(module_key, files)
+
+    def record(self, rel_path, digest, size, ok=True):
+        """Logs a finished file (or, with ok=False, a failed one, which keeps its module open)."""
+        parts = rel_path.split("/")
+        if len(parts) >= 3:
+            self._enter(f"{parts[0]}/{parts[1]}")
+            self.module_ok = self.module_ok and ok
+            self.file_hashes.append((rel_path, digest))
+        if ok:
+            self._append({"file": rel_path, "sha256": digest, "size": size})
+
+    def _enter(self, module_key):
+        if module_key == self.module_key:
+            return
+        self._end_module()
+        self.module_key = module_key
+        self.module_ok = True
+        self.file_hashes = []
+
+    def _end_module(self):
+        if self.module_key is None:
+            return
+        if self.module_ok:
+            self._append({"module": self.module_key, "sha256": self.module_hash(self.module_key, self.file_hashes)})
+        self.module_key = None
+        self.f.flush()
+
+    def end(self):
+        """Logs the last module, once every file of the run has been recorded."""
+        self._end_module()
+        self.f.flush()
+
+    def _append(self, entry):
+        self.f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def close(self):
+        self.f.close()
+
+    def finish(self):
+        """Deletes the journal of a completed build."""
+        self.close()
+        os.remove(self.path)
+
+
+def link_or_copy(src, dst):
+    """Hard-links src to dst, copying instead where links are not possible."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def carry_over(base_dir, out_dir, rel_path):
+    """Brings a file from the current tree into a staged build, if it still exists."""
+    src = os.path.join(base_dir, rel_path)
+    if os.path.isfile(src):
+        dst = os.path.join(out_dir, rel_path)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        link_or_copy(src, dst)
+
+
+def carry_over_extras(base_dir, out_dir, generated):
+    """
+    Links every file under base_dir that the build does not manage (the
+    paths in `generated`, plus the manifest) into a staged build, e.g.
+    hand-added notes, rendered outputs and search or stats indexes, so that
+    publishing the build does not move them into the .previous tree.
+    Returns how many were carried over.
+    """
+    carried = 0
+    for dirpath, _, filenames in os.walk(base_dir):
+        for filename in filenames:
+            src = os.path.join(dirpath, filename)
+            rel_path = os.path.relpath(src, base_dir).replace(os.sep, "/")
+            if rel_path in generated or rel_path == manifest_filename:
+                continue
+            dst = os.path.join(out_dir, rel_path)
+            if os.path.lexists(dst):
+                continue
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            link_or_copy(src, dst)
+            carried += 1
+    return carried
+
+
+def remove_orphans(base_dir, orphans, backend=None):
+    """Deletes orphaned files (paths relative to base_dir) and any directories they leave empty."""
+    backend = backend or disk_backend
+    base_dir = os.path.abspath(base_dir)
+    for rel_path in orphans:
+        path = os.path.join(base_dir, rel_path)
+        try:
+            backend.remove(path)
+        except FileNotFoundError:
+            pass
+        parent = os.path.dirname(os.path.abspath(path))
+        while parent != base_dir and parent.startswith(base_dir + os.sep):
+            try:
+                backend.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+
+
+def default_file_mode():
+    """The permissions open() gives a new file under the current umask."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def store_blob(blob_dir, digest, data, mode=None):
+    """
+    Stores data under its digest in blob_dir unless it is already there.
+    Returns (blob path, whether it was written). Blobs are written to a
+    temporary name and renamed, so concurrent writers of the same blob are
+    safe. They get `mode` (default: default_file_mode()), like plain writes.
+    """
+    path = os.path.join(blob_dir, digest[:2], digest)
+    if os.path.exists(path):
+        return path, False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.chmod(tmp_path, default_file_mode() if mode is None else mode)
+    os.replace(tmp_path, path)
+    return path, True
+
+
+def reflink(src, dst):
+    """Makes dst a copy-on-write clone of src; raises OSError where unsupported."""
+    import fcntl
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def materialize(blob_path, path):
+    """
+    Puts the blob at path: as a hard link where possible, else as a reflink,
+    else as a plain copy. Returns "link", "reflink", "copy" or "same" when
+    path already is the blob.
+    """
+    try:
+        if os.path.samefile(blob_path, path):
+            return "same"
+    except OSError:
+        pass
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.link(blob_path, tmp_path)
+        method = "link"
+    except OSError:
+        try:
+            reflink(blob_path, tmp_path)
+            method = "reflink"
+        except (OSError, ImportError):
+            shutil.copyfile(blob_path, tmp_path)
+            method = "copy"
+    os.replace(tmp_path, path)
+    return method
+
+
+def prune_blobs(blob_dir):
+    """
+    Deletes blobs no generated file links to any more. Returns how many were
+    removed. Only hard links count as references, so blobs materialized by
+    reflink or copy are removed too; the store simply refills next run.
+    """
+    removed = 0
+    for dirpath, _, filenames in os.walk(blob_dir):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if os.stat(path).st_nlink == 1:
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+def create_staging_dir(base_dir):
+    """Creates an empty build directory next to base_dir, on the same filesystem."""
+    base_dir = os.path.abspath(base_dir)
+    parent, name = os.path.split(base_dir)
+    os.makedirs(parent, exist_ok=True)
+    return tempfile.mkdtemp(prefix=f".{name}.staging-", dir=parent)
+
+
+def _libc():
+    if sys.platform != "linux":
+        return None
+    try:
+        import ctypes
+        return ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return None
+
+
+def sync_tree(root):
+    """
+    Flushes a freshly built tree to stable storage. Rather than fsyncing each
+    file, a single syncfs() covers the whole filesystem that holds root; where
+    that is unavailable, os.sync() is used, and only as a last resort are the
+    files and directories fsynced one by one.
+    """
+    libc = _libc()
+    if libc is not None and hasattr(libc, "syncfs"):
+        fd = os.open(root, os.O_RDONLY)
+        try:
+            if libc.syncfs(fd) == 0:
+                return
+        finally:
+            os.close(fd)
+    if hasattr(os, "sync"):
+        os.sync()
+        return
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            with open(os.path.join(dirpath, filename), "rb+") as f:
+                os.fsync(f.fileno())
+
+
+def fsync_dir(path):
+    if os.name != "posix":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def exchange_paths(a, b):
+    """
+    Atomically swaps two directory entries with renameat2(RENAME_EXCHANGE).
+    Returns False when the platform or filesystem does not support it.
+    """
+    libc = _libc()
+    if libc is None or not hasattr(libc, "renameat2"):
+        return False
+    at_fdcwd, rename_exchange = -100, 2
+    result = libc.renameat2(at_fdcwd, os.fsencode(a), at_fdcwd, os.fsencode(b), rename_exchange)
+    return result == 0
+
+
+def publish_staged(staging_dir, base_dir):
+    """
+    Replaces base_dir with staging_dir. Where supported this is one atomic
+    exchange, so readers see either the complete old tree or the complete new
+    one. The old tree is kept as base_dir + ".previous" for rollback_course().
+    """
+    base_dir = os.path.abspath(base_dir)
+    previous_dir = base_dir + previous_suffix
+    if not os.path.exists(base_dir):
+        os.rename(staging_dir, base_dir)
+    else:
+        if os.path.exists(previous_dir):
+            shutil.rmtree(previous_dir)
+        if exchange_paths(staging_dir, base_dir):
+            os.rename(staging_dir, previous_dir)
+        else:
+            os.rename(base_dir, previous_dir)
+            os.rename(staging_dir, base_dir)
+    fsync_dir(os.path.dirname(base_dir))
+
+
+def rollback_course(base_dir):
+    """Swaps the published tree with the one kept by the previous staged build."""
+    base_dir = os.path.abspath(base_dir)
+    previous_dir = base_dir + previous_suffix
+    if not os.path.isdir(previous_dir):
+        raise FileNotFoundError(f"No previous build to roll back to: {previous_dir}")
+    if not exchange_paths(previous_dir, base_dir):
+        swap_dir = create_staging_dir(base_dir)
+        os.rmdir(swap_dir)
+        os.rename(base_dir, swap_dir)
+        os.rename(previous_dir, base_dir)
+        os.rename(swap_dir, previous_dir)
+    fsync_dir(os.path.dirname(base_dir))
+    logger.info("Rolled back '%s' to the previous build.", base_dir)
+
+
+class CourseGenerationError(Exception):
+    """Raised after a run in which one or more files could not be written."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        lines = [f"{path}: {error}" for path, error in errors]
+        super().__init__(f"{len(errors)} file(s) could not be written:\n  " + "\n  ".join(lines))
+
+
+def run_bounded(func, items, jobs=1):
+    """
+    Applies func to each item, yielding (item, result, error) tuples in input
+    order. With jobs > 1 the calls run on a thread pool, with no more than a
+    few items per worker in flight so large inputs are never queued up at
+    once. OSErrors are returned rather than raised, so every failure can be
+    reported together and in a stable order.
+    """
+    if jobs <= 1:
+        for item in items:
+            try:
+                yield item, func(item), None
+            except OSError as error:
+                yield item, None, error
+        return
+
+    def collect(item, future):
+        try:
+            return item, future.result(), None
+        except OSError as error:
+            return item, None, error
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        pending = deque()
+        for item in items:
+            pending.append((item, pool.submit(func, item)))
+            if len(pending) >= jobs * 4:
+                yield collect(*pending.popleft())
+        while pending:
+            yield collect(*pending.popleft())
+
+
+class NullTracer:
+    """Stands in for tracing.Tracer when tracing is off; every span is a shared no-op."""
+
+    enabled = False
+    _span = contextlib.nullcontext()
+
+    def span(self, stage, detail=None):
+        return self._span
+
+    def touch(self, category, name):
+        pass
 
-        for module_name, lessons_dict in modules_dict.items():
-            module_path = os.path.join(phase_path, module_name)
-            os.makedirs(module_path, exist_ok=True) # Create module folder
-            print(f"    Created module directory: {module_path}")
 
+null_tracer = NullTracer()
+
+
+class DiskBackend:
+    """
+    The file operations a build performs, on the real filesystem. Builds take
+    a backend so they can run against something else, e.g. MemoryBackend.
+    """
+
+    def makedirs(self, path):
+        os.makedirs(path, exist_ok=True)
+
+    def open_write(self, path):
+        """
+        Opens path for writing. A file hard-linked elsewhere (to a dedup blob,
+        a staged build's .previous tree, a cohort) is replaced rather than
+        overwritten in place, so the other links keep their bytes.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return open(path, "wb")
+        linked = stat.S_ISREG(st.st_mode) and st.st_nlink > 1
+        return _ReplacingFile(path) if linked else open(path, "wb")
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def size(self, path):
+        """Returns the size of the file at path, or None if there is none."""
+        try:
+            return os.stat(path).st_size
+        except OSError:
+            return None
+
+    def replace(self, src, dst):
+        os.replace(src, dst)
+
+    def remove(self, path):
+        os.remove(path)
+
+    def rmdir(self, path):
+        os.rmdir(path)
+
+
+disk_backend = DiskBackend()
+
+
+class MemoryBackend:
+    """
+    Keeps a build entirely in RAM: files in a {absolute path: bytes} dict.
+    Generating into one touches no disk, and tree() hands back the result.
+    Staged and dedup builds, which rely on renames and links, need the disk.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.dirs = set()
+
+    def makedirs(self, path):
+        path = os.path.abspath(path)
+        while path not in self.dirs and path not in ("", ".", os.sep):
+            self.dirs.add(path)
+            path = os.path.dirname(path)
+
+    def open_write(self, path):
+        return _MemoryFile(self.files, os.path.abspath(path))
+
+    def read(self, path):
+        try:
+            return self.files[os.path.abspath(path)]
+        except KeyError:
+            raise FileNotFoundError(path) from None
+
+    def size(self, path):
+        data = self.files.get(os.path.abspath(path))
+        return None if data is None else len(data)
+
+    def replace(self, src, dst):
+        self.files[os.path.abspath(dst)] = self.read(src)
+        del self.files[os.path.abspath(src)]
+
+    def remove(self, path):
+        self.read(path)
+        del self.files[os.path.abspath(path)]
+
+    def rmdir(self, path):
+        path = os.path.abspath(path)
+        prefix = path + os.sep
+        if any(name.startswith(prefix) for name in itertools.chain(self.files, self.dirs)):
+            raise OSError(f"directory not empty: {path}")
+        self.dirs.discard(path)
+
+    def tree(self, root=None):
+        """Returns {path relative to root: bytes} for every file under root (absolute paths without one)."""
+        if root is None:
+            return dict(self.files)
+        root = os.path.abspath(root)
+        prefix = root + os.sep
+        return {name[len(prefix):]: data for name, data in self.files.items() if name.startswith(prefix)}
+
+
+class _ReplacingFile(io.FileIO):
+    """A file written under a temporary name and renamed over its target when closed without an error."""
+
+    def __init__(self, path):
+        self.target = path
+        super().__init__(f"{path}.{os.getpid()}.{threading.get_ident()}.tmp", "wb")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            super().close()
+            os.remove(self.name)
+
+    def close(self):
+        if not self.closed:
+            super().close()
+            try:
+                os.replace(self.name, self.target)
+            except OSError:
+                os.remove(self.name)
+                raise
+
+
+class _MemoryFile(io.BytesIO):
+    """A writable file whose bytes land in a MemoryBackend when it is closed."""
+
+    def __init__(self, files, path):
+        super().__init__()
+        self.target = files
+        self.path = path
+
+    def close(self):
+        if not self.closed:
+            self.target[self.path] = self.getvalue()
+        super().close()
+
+
+class GenerationStats:
+    """Counts files and bytes as a run progresses, and times each phase."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.written = 0
+        self.skipped = 0
+        self.bytes_written = 0
+        self.deduplicated = 0
+        # phase -> [time of its first record, time its last file finished]
+        self.phase_times = {}
+
+    def phase_started(self, phase_name):
+        if phase_name not in self.phase_times:
+            now = time.perf_counter()
+            self.phase_times[phase_name] = [now, now]
+
+    def record(self, rel_path, changed, size, deduplicated=False):
+        if changed:
+            self.written += 1
+            if deduplicated:
+                self.deduplicated += 1
+            else:
+                self.bytes_written += size
+        else:
+            self.skipped += 1
+        phase_name, sep, _ = rel_path.partition("/")
+        if sep and phase_name in self.phase_times:
+            self.phase_times[phase_name][1] = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def files_per_second(self):
+        elapsed = self.elapsed
+        return (self.written + self.skipped) / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            "files_written": self.written,
+            "files_skipped": self.skipped,
+            "bytes_written": self.bytes_written,
+            "files_deduplicated": self.deduplicated,
+            "elapsed_seconds": round(self.elapsed, 6),
+            "files_per_second": round(self.files_per_second(), 1),
+            "phases": {name: round(last - first, 6) for name, (first, last) in self.phase_times.items()},
+        }
+
+    def summary_line(self):
+        deduplicated = f" ({self.deduplicated} deduplicated)" if self.deduplicated else ""
+        return (f"{self.written} file(s) written{deduplicated}, {self.skipped} unchanged, "
+                f"{self.bytes_written} bytes in {self.elapsed:.2f}s "
+                f"({self.files_per_second():.0f} files/s)")
+
+
+class ProgressLine:
+    """Redraws a single status line on a terminal, at most a few times a second."""
+
+    interval = 0.1
+
+    def __init__(self, stats, stream=None):
+        self.stats = stats
+        self.stream = stream or sys.stderr
+        self.last_draw = 0.0
+        self.drawn = False
+
+    def update(self):
+        now = time.perf_counter()
+        if now - self.last_draw >= self.interval:
+            self.last_draw = now
+            self.draw()
+
+    def draw(self):
+        self.stream.write(f"\r{self.stats.summary_line()}\033[K")
+        self.stream.flush()
+        self.drawn = True
+
+    def finish(self):
+        if self.drawn:
+            self.stream.write("\r\033[K")
+            self.stream.flush()
+
+
+def create_course_materials(base_dir, outline, incremental=False, prune=False, jobs=1,
+                            staged=False, progress=False, tracer=None, dedup=False, blob_dir=None,
+                            formats=("md",), backend=None, resume=False):
+    """
+    Creates directories (phases, then modules) and Markdown lesson files
+    based on the provided course outline.
+
+    The outline is a nested {phase: {module: {lesson: content}}} dict, a
+    CompiledOutline, or an iterable of (phase, module, lesson_filename,
+    content) records, which are written as they arrive; all three produce
+    the same tree. A manifest of content hashes is kept in base_dir:
+    incremental=True writes only files whose hash changed, and prune=True
+    deletes files that left the outline. Writes run on `jobs` threads and
+    their failures are raised together as a CourseGenerationError.
+
+    staged builds next to base_dir and swaps the result in (see
+    publish_staged()); dedup and blob_dir store contents once in a blob
+    store and hard-link them, so such files must be edited by replacing
+    them (see store_blob()); `formats` adds files from output_formats;
+    `backend` defaults to disk_backend; resume continues a failed direct
+    build from its journal (see Journal); `tracer` and progress report on
+    the run. Returns the run's GenerationStats.as_dict() summary.
+    """
+    check_formats(formats)
+    backend = backend or disk_backend
+    if (staged or dedup or blob_dir) and not isinstance(backend, DiskBackend):
+        raise ValueError("staged and dedup builds need the disk backend")
+    if resume and (staged or not isinstance(backend, DiskBackend)):
+        raise ValueError("only direct builds on disk can be resumed")
+    stats = GenerationStats()
+    progress_line = ProgressLine(stats) if progress else None
+    tracer = tracer or null_tracer
+    options = {"incremental": incremental, "prune": prune, "jobs": jobs, "stats": stats,
+               "progress_line": progress_line, "tracer": tracer, "dedup": dedup, "blob_dir": blob_dir,
+               "formats": formats}
+    try:
+        if staged:
+            out_dir = create_staging_dir(base_dir)
+            try:
+                _build_course(base_dir, out_dir, outline, **options)
+                with tracer.span("sync"):
+                    sync_tree(out_dir)
+                with tracer.span("publish"):
+                    publish_staged(out_dir, base_dir)
+            except BaseException:
+                shutil.rmtree(out_dir, ignore_errors=True)
+                raise
+            logger.info("Published staged build to '%s'.", base_dir)
+        else:
+            _build_course(base_dir, base_dir, outline, backend=backend, resume=resume, **options)
+    finally:
+        if progress_line is not None:
+            progress_line.finish()
+    logger.info("Course materials generation complete! (%s)", stats.summary_line())
+    logger.info("You can find your course structure in the '%s' folder.", base_dir)
+    return stats.as_dict()
+
+
+def check_formats(formats):
+    """Raises ValueError unless formats is a valid selection from output_formats."""
+    unknown = [fmt for fmt in formats if fmt not in output_formats]
+    if unknown:
+        raise ValueError(f"unknown output format(s): {', '.join(unknown)} "
+                         f"(choose from {', '.join(output_formats)})")
+    if "md" not in formats:
+        raise ValueError("the md format is always generated")
+
+
+def practice_dirname(module_name):
+    """Names a module's practice folder: Module_1.2_Data_Types -> practice_1.2."""
+    prefix, _, rest = module_name.partition("_")
+    return f"practice_{rest.partition('_')[0] if prefix == 'Module' and rest else module_name}"
+
+
+# The stages below (writing, planning, archiving, the database) all consume
+# the outline as a sequence of OutlineLesson entries rather than walking the
+# nested dict themselves. A dict outline is compiled once: phases, modules
+# and lessons are put in natural order ("Module_1.10" after "Module_1.9")
+# instead of relying on dict insertion order, names are interned, and each
+# module's and lesson's relative paths are joined a single time, however
+# many stages and formats use them. Record streams are turned into the same
+# entries lazily, in stream order, so they are still never held in memory.
+
+
+class OutlineModule:
+    """A module of the outline, with its names interned and its paths precomputed."""
+
+    __slots__ = ("phase", "name", "key", "practice_dir", "rproj_path")
+
+    def __init__(self, phase_name, module_name):
+        self.phase = sys.intern(phase_name)
+        self.name = sys.intern(module_name)
+        self.key = sys.intern(f"{phase_name}/{module_name}")
+        practice_name = practice_dirname(module_name)
+        self.practice_dir = f"{self.key}/{practice_name}"
+        self.rproj_path = f"{self.practice_dir}/{practice_name}.Rproj"
+
+
+class OutlineLesson:
+    """One lesson of the outline: its module, file name, content and relative path."""
+
+    __slots__ = ("module", "filename", "content", "rel_path", "first_in_module")
+
+    def __init__(self, module, lesson_filename, content, first_in_module=False):
+        self.module = module
+        self.filename = lesson_filename
+        self.content = content
+        self.rel_path = f"{module.key}/{lesson_filename}"
+        self.first_in_module = first_in_module
+
+
+class CompiledOutline:
+    """An outline compiled by compile_outline(): its modules and lessons, in natural order."""
+
+    __slots__ = ("modules", "lessons")
+
+    def __init__(self, modules, lessons):
+        self.modules = modules
+        self.lessons = lessons
+
+    def __len__(self):
+        return len(self.lessons)
+
+    def __iter__(self):
+        return iter(self.lessons)
+
+
+def compile_outline(outline):
+    """
+    Compiles an outline dict (or a stream of records, gathered first) into a
+    CompiledOutline. Modules without lessons are kept, so their folders are
+    still created. A CompiledOutline is returned as it is.
+    """
+    if isinstance(outline, CompiledOutline):
+        return outline
+    if not isinstance(outline, Mapping):
+        records, outline = outline, {}
+        for phase_name, module_name, lesson_filename, content in records:
+            outline.setdefault(phase_name, {}).setdefault(module_name, {})[lesson_filename] = content
+    from outline_io import natural_key
+    modules, lessons = [], []
+    for phase_name in sorted(outline, key=natural_key):
+        modules_dict = outline[phase_name]
+        for module_name in sorted(modules_dict, key=natural_key):
+            module = OutlineModule(phase_name, module_name)
+            modules.append(module)
+            lessons_dict = modules_dict[module_name]
+            for i, lesson_filename in enumerate(sorted(lessons_dict, key=natural_key)):
+                lessons.append(OutlineLesson(module, lesson_filename, lessons_dict[lesson_filename], i == 0))
+    return CompiledOutline(modules, lessons)
+
+
+def stream_entries(records):
+    """Lazily turns (phase, module, lesson_filename, content) records into OutlineLessons, in stream order."""
+    modules = {}
+    for phase_name, module_name, lesson_filename, content in records:
+        module = modules.get((phase_name, module_name))
+        first_in_module = module is None
+        if first_in_module:
+            module = modules[(phase_name, module_name)] = OutlineModule(phase_name, module_name)
+        yield OutlineLesson(module, lesson_filename, content, first_in_module)
+
+
+def outline_entries(outline):
+    """Returns an iterator of OutlineLessons for a dict, a CompiledOutline or a record stream."""
+    if isinstance(outline, (Mapping, CompiledOutline)):
+        return iter(compile_outline(outline))
+    return stream_entries(outline)
+
+
+def lesson_files(lesson, data, formats=("md",)):
+    """
+    Returns (relative path, bytes) for every file one OutlineLesson yields in
+    the given formats: the Markdown lesson, its .Rmd twin, and with the
+    module's first lesson the module's .Rproj. All of them share the one
+    encoded lesson body, so extra formats only cost their own writes.
+    """
+    files = [(lesson.rel_path, data)]
+    if len(formats) > 1:
+        module = lesson.module
+        if "rmd" in formats:
+            files.append((f"{module.practice_dir}/{os.path.splitext(lesson.filename)[0]}.Rmd",
+                          rmd_header + data))
+        if "rproj" in formats and lesson.first_in_module:
+            files.append((module.rproj_path, rproj_file))
+    return files
+
+
+def record_files(phase_name, module_name, lesson_filename, data, formats=("md",), first_in_module=False):
+    """lesson_files() for a single (phase, module, lesson_filename) record."""
+    lesson = OutlineLesson(OutlineModule(phase_name, module_name), lesson_filename, None, first_in_module)
+    return lesson_files(lesson, data, formats)
+
+
+def iter_outline_records(outline):
+    """Flattens an outline dict into (phase, module, lesson_filename, content) records."""
+    for phase_name, modules_dict in outline.items():
+        for module_name, lessons_dict in modules_dict.items():
             for lesson_filename, content in lessons_dict.items():
-                lesson_path = os.path.join(module_path, lesson_filename)
-                with open(lesson_path, "w") as f:
-                    f.write(content)
-                print(f"      Created lesson file: {lesson_path}")
+                yield phase_name, module_name, lesson_filename, content
+
+
+def _build_course(base_dir, out_dir, outline, *, stats, tracer, incremental=False, prune=False, jobs=1,
+                  progress_line=None, dedup=False, blob_dir=None, formats=("md",), backend=disk_backend,
+                  resume=False):
+    """
+    Writes the course into out_dir, comparing against the manifest of
+    base_dir; a staged build passes its staging directory as out_dir. Takes
+    create_course_materials()'s options.
+    """
+    staged = out_dir != base_dir
+    backend.makedirs(out_dir)
+    if dedup and blob_dir is None:
+        blob_dir = os.path.join(out_dir, blob_dirname)
+    # Read once, before the writer threads start: reading the umask briefly clears it.
+    blob_mode = default_file_mode() if dedup else None
+    if not staged:
+        logger.info("Created base directory: %s", base_dir)
+
+    old_manifest = load_manifest(base_dir, backend)
+    journal = None
+    if not staged and isinstance(backend, DiskBackend):
+        journal = Journal(os.path.join(out_dir, journal_filename), resume)
+        if resume:
+            logger.info("Resuming: %d file(s) in %d module(s) already written.",
+                        len(journal.done["files"]), len(journal.done["modules"]))
+    manifest = {"files": {}, "modules": {}, "phases": {}}
+    # Lesson hashes per module key and module names per phase, in arrival order.
+    lesson_hashes = {}
+    phase_modules = {}
+
+    def make_directories(module):
+        if module.phase not in phase_modules:
+            with tracer.span("mkdir", module.phase):
+                backend.makedirs(os.path.join(out_dir, module.phase))
+            phase_modules[module.phase] = []
+            if not incremental:
+                logger.info("  Created phase directory: %s", os.path.join(base_dir, module.phase))
+        with tracer.span("mkdir", module.name):
+            backend.makedirs(os.path.join(out_dir, module.key)) # Create module folder
+            if len(formats) > 1:
+                backend.makedirs(os.path.join(out_dir, module.practice_dir))
+        phase_modules[module.phase].append(module.name)
+        lesson_hashes[module.key] = []
+        if not incremental:
+            logger.debug("    Created module directory: %s", os.path.join(base_dir, module.key))
+
+    def make_task(rel_path, content):
+        with tracer.span("prepare", rel_path):
+            data = content.encode("utf-8") if isinstance(content, str) else content
+            digest = content_hash(data)
+        manifest["files"][rel_path] = {"sha256": digest, "size": len(data)}
+        return os.path.join(base_dir, rel_path), rel_path, data, digest
+
+    if isinstance(outline, (Mapping, CompiledOutline)):
+        # The directory set is known up front, so create all of it first.
+        outline = compile_outline(outline)
+        for module in outline.modules:
+            make_directories(module)
+
+    # Files of modules the resumed journal finished, which need no checks.
+    finished = set()
+
+    def release(module_key, held):
+        if held and journal.is_module_done(module_key, [(task[1], task[3]) for task in held]):
+            finished.update(task[1] for task in held)
+        return held
+
+    def module_tasks():
+        for lesson in outline_entries(outline):
+            module = lesson.module
+            if module.key not in lesson_hashes:
+                make_directories(module)
+            stats.phase_started(module.phase)
+            if tracer.enabled:
+                tracer.touch("phase", module.phase)
+                tracer.touch("module", module.key)
+            task = make_task(lesson.rel_path, lesson.content)
+            yield module.key, task
+            if len(formats) > 1:
+                for rel_path, data in lesson_files(lesson, task[2], formats)[1:]:
+                    yield module.key, make_task(rel_path, data)
+            lesson_hashes[module.key].append((lesson.filename, task[3]))
+
+    def tasks():
+        yield make_task("README.md", course_readme)
+        if journal is None or not journal.done["modules"]:
+            yield from (task for _, task in module_tasks())
+            return
+        # Each module's tasks are held back until it is known whether the
+        # journal finished the whole module.
+        held, held_key = [], None
+        for module_key, task in module_tasks():
+            if module_key != held_key:
+                yield from release(held_key, held)
+                held, held_key = [], module_key
+            held.append(task)
+        yield from release(held_key, held)
+
+    def write_task(task):
+        """Returns (changed, deduplicated) for one file."""
+        path, rel_path, data, digest = task
+        out_path = os.path.join(out_dir, rel_path)
+        if rel_path in finished:
+            return False, False
+        if (journal is not None and journal.is_done(rel_path, digest, len(data))
+                and backend.size(path) == len(data)):
+            return False, False
+        if incremental:
+            with tracer.span("check", rel_path):
+                unchanged = is_unchanged(path, rel_path, digest, len(data), old_manifest, backend)
+            if unchanged:
+                if staged:
+                    with tracer.span("link", rel_path):
+                        link_or_copy(path, out_path)
+                return False, False
+        if dedup:
+            with tracer.span("write", rel_path):
+                blob_path, written = store_blob(blob_dir, digest, data, blob_mode)
+            with tracer.span("link", rel_path):
+                materialize(blob_path, out_path)
+            return True, not written
+        with tracer.span("open", rel_path):
+            f = backend.open_write(out_path)
+        with f, tracer.span("write", rel_path):
+            f.write(data)
+        return True, False
+
+    errors = []
+    try:
+        for (path, rel_path, data, digest), result, error in run_bounded(write_task, tasks(), jobs):
+            if journal is not None:
+                journal.record(rel_path, digest, len(data), error is None)
+            if error is not None:
+                errors.append((path, error))
+                continue
+            changed, deduplicated = result
+            stats.record(rel_path, changed, len(data), deduplicated)
+            if tracer.enabled and rel_path.count("/") == 2:
+                module_key = rel_path.rpartition("/")[0]
+                tracer.touch("phase", module_key.partition("/")[0])
+                tracer.touch("module", module_key)
+            if changed:
+                if rel_path == "README.md":
+                    logger.debug("Created info.md in the base directory.")
+                else:
+                    logger.debug("      Created lesson file: %s", path)
+            if progress_line is not None:
+                progress_line.update()
+        if journal is not None:
+            journal.end()
+    finally:
+        # Kept on failure, so the run can be resumed.
+        if journal is not None:
+            journal.close()
+    if errors:
+        raise CourseGenerationError(errors)
+
+    for phase_name, module_names in phase_modules.items():
+        module_hashes = []
+        for module_name in module_names:
+            module_key = f"{phase_name}/{module_name}"
+            module_hash = combined_hash(lesson_hashes[module_key])
+            manifest["modules"][module_key] = module_hash
+            module_hashes.append((module_name, module_hash))
+            if incremental and old_manifest["modules"].get(module_key) != module_hash:
+                logger.debug("    Updated module: %s", os.path.join(base_dir, phase_name, module_name))
+        phase_hash = combined_hash(module_hashes)
+        manifest["phases"][phase_name] = phase_hash
+        if incremental and old_manifest["phases"].get(phase_name) != phase_hash:
+            logger.info("  Updated phase: %s", os.path.join(base_dir, phase_name))
+
+    orphans = sorted(set(old_manifest["files"]) - set(manifest["files"]))
+    if orphans:
+        if prune:
+            if not staged:
+                remove_orphans(base_dir, orphans, backend)
+            logger.info("Removed %d orphaned file(s):", len(orphans))
+        else:
+            # Keep tracking them so the next run still reports them.
+            for rel_path in orphans:
+                manifest["files"][rel_path] = old_manifest["files"][rel_path]
+                if staged:
+                    carry_over(base_dir, out_dir, rel_path)
+            logger.warning("Found %d orphaned file(s) (use --prune to delete):", len(orphans))
+        for path in orphans:
+            logger.info("      %s", path)
+
+    if staged:
+        carried = carry_over_extras(base_dir, out_dir, set(old_manifest["files"]) | set(manifest["files"]))
+        if carried:
+            logger.info("Carried over %d file(s) not made by the generator.", carried)
+
+    if dedup and prune:
+        removed = prune_blobs(blob_dir)
+        if removed:
+            logger.info("Removed %d unreferenced blob(s) from %s.", removed, blob_dir)
+
+    if staged or manifest != old_manifest:
+        with tracer.span("manifest"):
+            save_manifest(out_dir, manifest, backend)
+    if journal is not None:
+        journal.finish()
+
+
+def scan_tree(base_dir):
+    """
+    Walks base_dir once with os.scandir and returns {relative path: size} for
+    every file, skipping hidden entries such as the manifest and .git.
+    """
+    index = {}
+    stack = [(base_dir, "")]
+    while stack:
+        path, prefix = stack.pop()
+        try:
+            it = os.scandir(path)
+        except FileNotFoundError:
+            continue
+        with it:
+            for entry in it:
+                if entry.name.startswith("."):
+                    continue
+                rel_path = prefix + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, rel_path + "/"))
+                elif entry.is_file():
+                    index[rel_path] = entry.stat().st_size
+    return index
+
+
+def hash_path(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def plan_course(base_dir, outline, jobs=1, formats=("md",)):
+    """
+    Reports what create_course_materials would do to base_dir, without
+    writing anything. Returns a dict of relative paths under "create" (not on
+    disk), "update" (content differs), "unchanged" and "extra" (on disk but
+    not generated).
+
+    The tree is scanned once. A file whose size differs from the generated
+    content is an update without being read; only same-size files are hashed,
+    on up to `jobs` threads.
+    """
+    check_formats(formats)
+    index = scan_tree(base_dir)
+
+    def files():
+        for lesson in outline_entries(outline):
+            yield from lesson_files(lesson, lesson.content.encode("utf-8"), formats)
+
+    plan = {"create": [], "update": [], "unchanged": [], "extra": []}
+    expected = set()
+    candidates = []
+    for rel_path, data in itertools.chain([("README.md", course_readme.encode("utf-8"))], files()):
+        expected.add(rel_path)
+        size = index.get(rel_path)
+        if size is None:
+            plan["create"].append(rel_path)
+        elif size != len(data):
+            plan["update"].append(rel_path)
+        else:
+            candidates.append((rel_path, content_hash(data)))
+
+    def check(candidate):
+        rel_path, digest = candidate
+        return hash_path(os.path.join(base_dir, rel_path)) == digest
+
+    for (rel_path, _), same, _ in run_bounded(check, candidates, jobs):
+        plan["unchanged" if same else "update"].append(rel_path)
+    plan["extra"] = sorted(set(index) - expected)
+    return plan
+
+
+def report_plan(base_dir, plan):
+    logger.info("Plan for '%s': %d to create, %d to update, %d unchanged, %d extra",
+                base_dir, len(plan["create"]), len(plan["update"]), len(plan["unchanged"]), len(plan["extra"]))
+    for action in ("create", "update", "unchanged", "extra"):
+        log = logger.debug if action == "unchanged" else logger.info
+        for rel_path in plan[action]:
+            log("  %-9s %s", action, rel_path)
+
+
+# Archive formats create_course_archive() can write, by file extension.
+archive_formats = {
+    ".zip": "zip",
+    ".tar": "tar",
+    ".tar.gz": "tar.gz",
+    ".tgz": "tar.gz",
+    ".tar.zst": "tar.zst",
+}
+
+# Entries get this fixed timestamp (1980-01-01, the earliest a zip can hold)
+# unless SOURCE_DATE_EPOCH says otherwise, so identical outlines produce
+# byte-identical archives.
+archive_epoch = 315532800
+
+
+def archive_format(path):
+    """Returns the archive format implied by path's extension, or raises ValueError."""
+    for extension, fmt in sorted(archive_formats.items(), key=lambda item: -len(item[0])):
+        if path.endswith(extension):
+            if fmt == "tar.zst":
+                try:
+                    import zstandard  # noqa: F401
+                except ImportError:
+                    raise ValueError("writing .tar.zst archives needs the zstandard package") from None
+            return fmt
+    raise ValueError(f"unsupported archive type for '{path}' "
+                     f"(use one of: {', '.join(archive_formats)})")
+
+
+class ArchiveWriter:
+    """Adds directories and files to a zip or tar stream with fixed metadata."""
+
+    def __init__(self, fileobj, fmt, mtime):
+        # The archive modules are imported here, not at the top, to keep startup fast.
+        import gzip
+        import tarfile
+        import zipfile
+        self.fmt = fmt
+        self.mtime = mtime
+        self.layers = []
+        if fmt == "zip":
+            self.archive = zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED)
+            self.date_time = time.gmtime(max(mtime, archive_epoch))[:6]
+            return
+        if fmt == "tar.gz":
+            fileobj = gzip.GzipFile(filename="", mode="wb", fileobj=fileobj, mtime=0)
+            self.layers.append(fileobj)
+        elif fmt == "tar.zst":
+            import zstandard
+            fileobj = zstandard.ZstdCompressor().stream_writer(fileobj, closefd=False)
+            self.layers.append(fileobj)
+        self.archive = tarfile.open(fileobj=fileobj, mode="w|", format=tarfile.PAX_FORMAT)
+
+    def add_dir(self, name):
+        import tarfile
+        import zipfile
+        if self.fmt == "zip":
+            info = zipfile.ZipInfo(name + "/", self.date_time)
+            info.create_system = 3
+            info.external_attr = (0o40755 << 16) | 0x10
+            self.archive.writestr(info, b"")
+        else:
+            info = self._tarinfo(name, tarfile.DIRTYPE, 0o755)
+            self.archive.addfile(info)
+
+    def add_file(self, name, data):
+        import tarfile
+        import zipfile
+        if self.fmt == "zip":
+            info = zipfile.ZipInfo(name, self.date_time)
+            info.create_system = 3
+            info.external_attr = 0o100644 << 16
+            info.compress_type = zipfile.ZIP_DEFLATED
+            self.archive.writestr(info, data)
+        else:
+            info = self._tarinfo(name, tarfile.REGTYPE, 0o644)
+            info.size = len(data)
+            self.archive.addfile(info, io.BytesIO(data))
+
+    def _tarinfo(self, name, kind, mode):
+        import tarfile
+        info = tarfile.TarInfo(name)
+        info.type = kind
+        info.mode = mode
+        info.mtime = self.mtime
+        info.uid = info.gid = 0
+        info.uname = info.gname = ""
+        return info
+
+    def close(self):
+        self.archive.close()
+        for layer in reversed(self.layers):
+            layer.close()
+
+
+def create_course_archive(archive_path, outline, root=base_course_dir, tracer=None, formats=("md",)):
+    """
+    Streams the course (README, phase and module folders, lesson files) into a
+    single zip or tar archive under the top-level folder `root`, without
+    writing the tree to disk first. The format follows archive_path's
+    extension (see archive_formats). Entries are added in outline order with
+    fixed timestamps, owners and permissions, so the same outline always
+    gives a byte-identical archive. The outline may be a dict or a stream of
+    records, and `formats` selects the same extra files, as for
+    create_course_materials().
+    """
+    check_formats(formats)
+    fmt = archive_format(archive_path)
+    tracer = tracer or null_tracer
+    mtime = int(os.environ.get("SOURCE_DATE_EPOCH", archive_epoch))
+
+    tmp_path = archive_path + ".tmp"
+    stats = GenerationStats()
+    try:
+        with open(tmp_path, "wb") as f:
+            writer = ArchiveWriter(f, fmt, mtime)
+            writer.add_dir(root)
+            data = course_readme.encode("utf-8")
+            writer.add_file(f"{root}/README.md", data)
+            stats.record("README.md", True, len(data))
+            phases = set()
+            for lesson in outline_entries(outline):
+                module = lesson.module
+                if module.phase not in phases:
+                    phases.add(module.phase)
+                    stats.phase_started(module.phase)
+                    writer.add_dir(f"{root}/{module.phase}")
+                    logger.info("  Added phase directory: %s", module.phase)
+                if lesson.first_in_module:
+                    writer.add_dir(f"{root}/{module.key}")
+                    if len(formats) > 1:
+                        writer.add_dir(f"{root}/{module.practice_dir}")
+                    logger.debug("    Added module directory: %s", module.key)
+                if tracer.enabled:
+                    tracer.touch("phase", module.phase)
+                    tracer.touch("module", module.key)
+                with tracer.span("prepare", lesson.rel_path):
+                    files = lesson_files(lesson, lesson.content.encode("utf-8"), formats)
+                for rel_path, data in files:
+                    with tracer.span("write", rel_path):
+                        writer.add_file(f"{root}/{rel_path}", data)
+                    stats.record(rel_path, True, len(data))
+                logger.debug("      Added lesson file: %s", lesson.filename)
+            writer.close()
+        os.replace(tmp_path, archive_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    logger.info("Course archive complete! (%s to '%s')", stats.summary_line(), archive_path)
+    return stats.as_dict()
+
+
+def configure_logging(verbosity):
+    """
+    Sends the "generate" logger to stdout: warnings only when verbosity < 0,
+    phase-level progress at 0, every module and file when > 0. Records are
+    buffered and flushed in batches rather than one write per line.
+    """
+    import logging.handlers
+    level = logging.WARNING if verbosity < 0 else logging.INFO if verbosity == 0 else logging.DEBUG
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("%(message)s"))
+    handler = logging.handlers.MemoryHandler(1024, flushLevel=logging.WARNING, target=stream_handler)
+    logger.handlers[:] = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
+    atexit.register(handler.flush)
+    return handler
+
+
+def flush_log():
+    """Writes out any log records still held in the buffer."""
+    for handler in logger.handlers:
+        handler.flush()
+
+
+def write_summary(path, summary):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+        f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the R programming course materials.")
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument("-q", "--quiet", action="store_const", dest="verbosity", const=-1, default=0,
+                           help="only report warnings and errors")
+    verbosity.add_argument("-v", "--verbose", action="store_const", dest="verbosity", const=1,
+                           help="report every module and file")
+    parser.add_argument("--summary-json", metavar="FILE",
+                        help="write a JSON summary of the run (files, bytes, time per phase) to FILE")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="record timing spans for every generation step and write them to FILE "
+                             "as Chrome/Perfetto trace JSON, with a per-stage histogram")
+    parser.add_argument("--output", default=base_course_dir,
+                        help=f"directory to generate the course into (default: {base_course_dir})")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only write files whose content changed since the last run")
+    parser.add_argument("--prune", action="store_true",
+                        help="delete files from the last run that are no longer in the outline")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="number of threads writing files in parallel, and of --site rendering processes "
+                             "(default: 1 thread, and a process per CPU)")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted run from its journal, skipping the files it "
+                             "already finished")
+    parser.add_argument("--staged", action="store_true",
+                        help="build in a temporary directory and swap it into place when complete")
+    parser.add_argument("--formats", default="md", type=lambda text: tuple(text.split(",")),
+                        help=f"comma-separated formats to emit in one pass, from: {', '.join(output_formats)} "
+                             "(default: md)")
+    parser.add_argument("--dedup", action="store_true",
+                        help="store each distinct file content once and hard-link (or reflink, or "
+                             "copy) it into place")
+    parser.add_argument("--blob-dir", metavar="DIR",
+                        help=f"blob store for --dedup, shareable between builds (default: "
+                             f"<output>/{blob_dirname})")
+    parser.add_argument("--archive", metavar="FILE",
+                        help="write the course straight into a .zip, .tar, .tar.gz/.tgz or .tar.zst "
+                             "archive instead of a directory")
+    parser.add_argument("--database", metavar="FILE",
+                        help="write the course into a SQLite database instead of a directory, "
+                             "updating only the rows that changed since the last run")
+    parser.add_argument("--fts", action="store_true",
+                        help="with --database, also keep an FTS5 full-text index of the lesson bodies")
+    parser.add_argument("--plan", action="store_true",
+                        help="report the files that would be created, updated or left alone, and any "
+                             "extra files in the output directory, without writing anything")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and regenerate only the lessons affected by each edit "
+                             "to the outline")
+    parser.add_argument("--index", action="store_true",
+                        help="bring the full-text search index of the output directory up to date "
+                             "after generating (see search_index.py)")
+    parser.add_argument("--stats", metavar="FILE",
+                        help="after generating, write per-lesson, module and phase word counts, reading "
+                             "time, code chunks and bullets to FILE, as CSV or .json (see course_stats.py)")
+    parser.add_argument("--site", metavar="DIR",
+                        help="after generating, bring the static HTML site in DIR up to date, rendering "
+                             "only the pages whose lesson or neighbours changed (see course_site.py)")
+    parser.add_argument("--rollback", action="store_true",
+                        help="restore the tree replaced by the last staged build, then exit")
+    parser.add_argument("--outline", metavar="PATH",
+                        help="load the outline from a JSON/TOML/Markdown file or directory, or "
+                             "stream it from a JSON Lines file ('-' for stdin), instead of the "
+                             "built-in one")
+    parser.add_argument("--no-outline-cache", action="store_true",
+                        help="parse the --outline sources without reading or writing the compiled cache")
+    parser.add_argument("--export-outline", metavar="FILE",
+                        help="write the outline as JSON to FILE, then exit")
+    args = parser.parse_args(argv)
+    log_handler = configure_logging(args.verbosity)
+    if args.rollback:
+        try:
+            rollback_course(args.output)
+        except OSError as error:
+            parser.exit(1, f"error: {error}\n")
+        return
+    outline = course_outline
+    expected_errors = (CourseGenerationError,)
+    if args.outline or args.export_outline:
+        import outline_io
+        expected_errors += (outline_io.OutlineError,)
+        if args.outline and outline_io.is_record_stream(args.outline):
+            if args.export_outline:
+                parser.error("--export-outline needs an outline that fits in memory, not a JSON Lines stream")
+            try:
+                outline = outline_io.read_outline_jsonl(args.outline)
+            except outline_io.OutlineError as error:
+                parser.exit(1, f"error: {error}\n")
+        elif args.outline and args.watch and not args.export_outline:
+            pass  # watch mode parses the sources itself, without the cache file
+        elif args.outline:
+            try:
+                outline = outline_io.load_outline(args.outline, use_cache=not args.no_outline_cache)
+            except (OSError, outline_io.OutlineError) as error:
+                parser.exit(1, f"error: {error}\n")
+        if args.export_outline:
+            outline_io.dump_outline(outline, args.export_outline)
+            logger.info("Wrote outline to '%s'.", args.export_outline)
+            return
+    if args.archive:
+        try:
+            archive_format(args.archive)
+        except ValueError as error:
+            parser.error(str(error))
+    try:
+        check_formats(args.formats)
+    except ValueError as error:
+        parser.error(str(error))
+    if (args.index or args.stats or args.site) and (args.archive or args.plan or args.database):
+        parser.error("--index, --stats and --site need a generated directory, not --archive, --database or --plan")
+    if args.fts and not args.database:
+        parser.error("--fts only applies to --database")
+    if args.resume and (args.archive or args.database or args.plan or args.watch or args.staged):
+        parser.error("--resume cannot be combined with --archive, --database, --plan, --watch or --staged")
+    if args.watch:
+        if args.archive or args.database or args.plan or args.staged or len(args.formats) > 1:
+            parser.error("--watch cannot be combined with --archive, --database, --plan, --staged or --formats")
+        if args.outline and outline_io.is_record_stream(args.outline):
+            parser.error("--watch needs an outline file or directory, not a JSON Lines stream")
+        import watcher
+        try:
+            if args.outline:
+                paths = [args.outline]
+                source = outline_io.OutlineSources(args.outline)
+            else:
+                import runpy
+                paths = [os.path.abspath(__file__)]
+                source = watcher.ReloadingSource(lambda: runpy.run_path(paths[0])["course_outline"])
+            watcher.watch_course(args.output, source, paths, jobs=args.jobs or 1)
+        except expected_errors as error:
+            log_handler.flush()
+            parser.exit(1, f"error: {error}\n")
+        return
+
+    if isinstance(outline, Mapping):
+        outline = compile_outline(outline)
+    progress = args.verbosity == 0 and sys.stderr.isatty()
+    tracer = None
+    if args.trace:
+        import tracing
+        tracer = tracing.Tracer()
+    try:
+        if args.plan:
+            summary = plan_course(args.output, outline, jobs=args.jobs or 1, formats=args.formats)
+            report_plan(args.output, summary)
+        elif args.database:
+            import course_db
+            summary = course_db.create_course_database(args.database, outline, fts=args.fts)
+        elif args.archive:
+            summary = create_course_archive(args.archive, outline,
+                                            root=os.path.basename(os.path.abspath(args.output)),
+                                            tracer=tracer, formats=args.formats)
+        else:
+            summary = create_course_materials(args.output, outline, incremental=args.incremental,
+                                              prune=args.prune, jobs=args.jobs or 1, staged=args.staged,
+                                              progress=progress, tracer=tracer,
+                                              dedup=args.dedup or bool(args.blob_dir), blob_dir=args.blob_dir,
+                                              formats=args.formats, resume=args.resume)
+    except expected_errors as error:
+        log_handler.flush()
+        parser.exit(1, f"error: {error}\n")
+    if args.index:
+        import search_index
+        summary["search_index"] = search_index.update_index(args.output)
+    if args.stats:
+        import course_stats
+        corpus, summary["stats"] = course_stats.collect_stats(args.output)
+        course_stats.write_report(args.stats, corpus.report())
+    if args.site:
+        import course_site
+        try:
+            summary["site"] = course_site.build_site(args.output, args.site, jobs=args.jobs)
+        except (OSError, CourseGenerationError) as error:
+            log_handler.flush()
+            parser.exit(1, f"error: {error}\n")
+    if tracer is not None:
+        tracer.export_chrome(args.trace)
+        summary["stages"] = tracer.histogram()
+        logger.info("Wrote trace to '%s'.\n%s", args.trace, tracer.format_histogram())
+    if args.summary_json:
+        write_summary(args.summary_json, summary)
 
-    print("\nCourse materials generation complete!")
-    print(f"You can find your course structure in the '{base_course_dir}' folder.")
 
 if __name__ == "__main__":
-    create_course_materials(base_course_dir, course_outline)
\ No newline at end of file
+    main()
@@ -0,0 +1,390 @@
+import hashlib
+import itertools
+import json
+import marshal
+import os
+import re
+import sys
+
+# Loads a course outline ({phase: {module: {lesson_filename: content}}}) from
+# data files instead of the dict literal in generate.py. A source can be a
+# single file or a directory searched recursively for:
+#
+#   *.json  a (partial) outline in the nested dict shape above
+#   *.toml  the same shape in TOML (needs Python 3.11+ or the tomli package)
+#   *.md    one lesson per file. Front matter may set phase, module and
+#           lesson; anything missing is taken from the file's location, so
+#           <phase>/<module>/<lesson>.md inside the source directory works
+#           without front matter at all.
+#
+# Files are merged in natural path order ("lesson_2" before "lesson_10") and
+# later files override lessons defined by earlier ones. The merged outline
+# is cached in a marshal file keyed by the sizes, mtimes and hashes of every
+# source, so an unchanged outline loads with a single read.
+#
+# Outlines too large for memory can instead be streamed from JSON Lines, one
+# lesson per line, as either {"phase", "module", "lesson", "content"}
+# objects or [phase, module, lesson, content] arrays.
+
+cache_version = 1
+source_extensions = (".json", ".toml", ".md")
+
+
+class OutlineError(ValueError):
+    """Raised when an outline source file cannot be interpreted."""
+
+
+def natural_key(text):
+    """Sort key that orders embedded numbers numerically, e.g. 1.9 before 1.10."""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", text)]
+
+
+def find_sources(path):
+    """Returns the (relative path, size, mtime_ns) of every outline source under path."""
+    if os.path.isfile(path):
+        st = os.stat(path)
+        return [(os.path.basename(path), st.st_size, st.st_mtime_ns)]
+    sources = []
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(path, rel_dir)) as it:
+            for entry in it:
+                if entry.name.startswith("."):
+                    continue
+                rel_path = os.path.join(rel_dir, entry.name)
+                if entry.is_dir():
+                    stack.append(rel_path)
+                elif entry.name.endswith(source_extensions):
+                    st = entry.stat()
+                    sources.append((rel_path, st.st_size, st.st_mtime_ns))
+    sources.sort(key=lambda source: natural_key(source[0]))
+    return sources
+
+
+def default_cache_path(path):
+    if os.path.isdir(path):
+        return os.path.join(path, ".outline_cache")
+    head, tail = os.path.split(path)
+    return os.path.join(head, f".{tail}.outline_cache")
+
+
+def load_outline(path, cache_path=None, use_cache=True):
+    """
+    Loads the outline stored at path (a file or a directory of files).
+
+    The compiled cache is used when every source still has the size and mtime
+    it had when the cache was written. If only mtimes moved, the sources are
+    hashed and the cache is still used (and refreshed) when the content is the
+    same. Otherwise the sources are parsed again and the cache rewritten.
+    """
+    if cache_path is None:
+        cache_path = default_cache_path(path)
+    root = path if os.path.isdir(path) else os.path.dirname(path)
+    sources = find_sources(path)
+
+    cache = read_cache(cache_path) if use_cache else None
+    if cache is not None:
+        cached_sources = [tuple(source[:3]) for source in cache["sources"]]
+        if cached_sources == sources:
+            return cache["outline"]
+        if [source[:2] for source in cached_sources] == [source[:2] for source in sources]:
+            hashes = [hash_file(os.path.join(root, rel_path)) for rel_path, _, _ in sources]
+            if hashes == [source[3] for source in cache["sources"]]:
+                write_cache(cache_path, sources, hashes, cache["outline"])
+                return cache["outline"]
+
+    outline = {}
+    hashes = []
+    for rel_path, _, _ in sources:
+        with open(os.path.join(root, rel_path), "rb") as f:
+            data = f.read()
+        hashes.append(hashlib.sha256(data).hexdigest())
+        merge_outline(outline, parse_source(rel_path, data))
+    if use_cache:
+        write_cache(cache_path, sources, hashes, outline)
+    return outline
+
+
+def hash_file(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def read_cache(cache_path):
+    try:
+        with open(cache_path, "rb") as f:
+            cache = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(cache, dict) or cache.get("version") != cache_version:
+        return None
+    return cache
+
+
+def write_cache(cache_path, sources, hashes, outline):
+    cache = {
+        "version": cache_version,
+        "sources": [source + (digest,) for source, digest in zip(sources, hashes)],
+        "outline": outline,
+    }
+    tmp_path = cache_path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            marshal.dump(cache, f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # A read-only source tree simply goes without a cache.
+        pass
+
+
+class OutlineSources:
+    """
+    An outline kept together with the parsed fragment of each of its
+    sources, for watch mode: update() reparses only the sources it is told
+    changed and works out which lessons that added, changed or removed,
+    with later sources (in natural path order) still overriding earlier
+    ones, so the cost of an edit depends on the files touched, not on the
+    size of the outline. `outline` is the merged outline. No cache file is
+    written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.root = os.path.abspath(path if os.path.isdir(path) else os.path.dirname(path) or ".")
+        self.only = None if os.path.isdir(path) else os.path.basename(path)
+        self.fragments = {}
+        # (phase, module, lesson) and (phase, module) -> the sources defining it
+        self.lesson_sources = {}
+        self.module_sources = {}
+        self.outline = {}
+        try:
+            sources = find_sources(path)
+        except OSError as error:
+            raise OutlineError(f"{path}: {error.strerror}") from None
+        self.update(os.path.join(self.root, rel_path) for rel_path, _, _ in sources)
+
+    def source_paths(self, paths):
+        """Expands changed paths (files or directories, existing or not) into source paths relative to root."""
+        found = set()
+        for path in paths:
+            rel_path = os.path.relpath(os.path.abspath(path), self.root)
+            if rel_path.startswith(os.pardir) or any(part.startswith(".") for part in rel_path.split(os.sep)):
+                continue
+            if self.only is not None:
+                if rel_path == self.only:
+                    found.add(rel_path)
+                continue
+            if os.path.isdir(path):
+                found.update(os.path.join(rel_path, source) for source, _, _ in find_sources(path))
+                prefix = rel_path + os.sep
+                found.update(known for known in self.fragments if known.startswith(prefix))
+            elif rel_path.endswith(source_extensions):
+                found.add(rel_path)
+            else:
+                prefix = rel_path + os.sep
+                found.update(known for known in self.fragments if known.startswith(prefix))
+        return found
+
+    def update(self, paths):
+        """
+        Reparses the sources at (or under) the given paths. Returns (changed,
+        removed) as watcher.diff_outlines() does: the (phase, module, lesson,
+        content) records that are new or different, and the (phase, module,
+        lesson) triples that are gone. Raises OutlineError, leaving the
+        outline as it was, when a source cannot be parsed.
+        """
+        parsed = {}
+        for rel_path in self.source_paths(paths):
+            try:
+                with open(os.path.join(self.root, rel_path), "rb") as f:
+                    data = f.read()
+            except (FileNotFoundError, IsADirectoryError):
+                parsed[rel_path] = None
+                continue
+            except OSError as error:
+                raise OutlineError(f"{rel_path}: {error.strerror}") from None
+            parsed[rel_path] = parse_source(rel_path, data)
+
+        lessons, modules = set(), set()
+        for rel_path, fragment in parsed.items():
+            for old_new, register in ((self.fragments.pop(rel_path, None), False), (fragment, True)):
+                for phase_name, modules_dict in (old_new or {}).items():
+                    for module_name, lessons_dict in modules_dict.items():
+                        modules.add((phase_name, module_name))
+                        self._register(self.module_sources, (phase_name, module_name), rel_path, register)
+                        for lesson_filename in lessons_dict:
+                            lessons.add((phase_name, module_name, lesson_filename))
+                            self._register(self.lesson_sources, (phase_name, module_name, lesson_filename),
+                                           rel_path, register)
+            if fragment is not None:
+                self.fragments[rel_path] = fragment
+
+        changed, removed = [], []
+        for key in sorted(lessons):
+            phase_name, module_name, lesson_filename = key
+            sources = self.lesson_sources.get(key)
+            lessons_dict = self.outline.get(phase_name, {}).get(module_name, {})
+            if sources:
+                winner = max(sources, key=natural_key)
+                content = self.fragments[winner][phase_name][module_name][lesson_filename]
+                if lessons_dict.get(lesson_filename) != content:
+                    self.outline.setdefault(phase_name, {}).setdefault(module_name, {})[lesson_filename] = content
+                    changed.append((phase_name, module_name, lesson_filename, content))
+            elif lesson_filename in lessons_dict:
+                del lessons_dict[lesson_filename]
+                removed.append(key)
+        for phase_name, module_name in modules:
+            if self.module_sources.get((phase_name, module_name)):
+                self.outline.setdefault(phase_name, {}).setdefault(module_name, {})
+                continue
+            modules_dict = self.outline.get(phase_name, {})
+            modules_dict.pop(module_name, None)
+            if not modules_dict:
+                self.outline.pop(phase_name, None)
+        return changed, removed
+
+    @staticmethod
+    def _register(index, key, rel_path, add):
+        if add:
+            index.setdefault(key, set()).add(rel_path)
+        else:
+            sources = index.get(key)
+            if sources is not None:
+                sources.discard(rel_path)
+                if not sources:
+                    del index[key]
+
+
+def merge_outline(outline, fragment):
+    for phase_name, modules_dict in fragment.items():
+        phase = outline.setdefault(phase_name, {})
+        for module_name, lessons_dict in modules_dict.items():
+            phase.setdefault(module_name, {}).update(lessons_dict)
+
+
+def parse_source(rel_path, data):
+    """Turns the bytes of one source file into a (partial) outline."""
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError as error:
+        raise OutlineError(f"{rel_path}: not valid UTF-8 ({error.reason} at byte {error.start})") from None
+    if rel_path.endswith(".json"):
+        try:
+            fragment = json.loads(text)
+        except ValueError as error:
+            raise OutlineError(f"{rel_path}: {error}") from None
+    elif rel_path.endswith(".toml"):
+        fragment = parse_toml(rel_path, text)
+    else:
+        return parse_markdown_lesson(rel_path, text)
+    check_fragment(rel_path, fragment)
+    return fragment
+
+
+def parse_toml(rel_path, text):
+    try:
+        import tomllib
+    except ImportError:
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise OutlineError(f"{rel_path}: reading TOML needs Python 3.11+ or the tomli package") from None
+    try:
+        return tomllib.loads(text)
+    except tomllib.TOMLDecodeError as error:
+        raise OutlineError(f"{rel_path}: {error}") from None
+
+
+def check_fragment(rel_path, fragment):
+    if not isinstance(fragment, dict):
+        raise OutlineError(f"{rel_path}: expected a table of phases")
+    for phase_name, modules_dict in fragment.items():
+        if not isinstance(modules_dict, dict):
+            raise OutlineError(f"{rel_path}: phase {phase_name!r} must map module names to lessons")
+        for module_name, lessons_dict in modules_dict.items():
+            if not isinstance(lessons_dict, dict):
+                raise OutlineError(f"{rel_path}: module {module_name!r} must map lesson files to content")
+            for lesson_filename, content in lessons_dict.items():
+                if not isinstance(content, str):
+                    raise OutlineError(f"{rel_path}: lesson {lesson_filename!r} must be a string")
+
+
+def parse_markdown_lesson(rel_path, text):
+    meta = {}
+    if text.startswith("---\n"):
+        end = text.find("\n---\n", 3)
+        if end != -1:
+            for line in text[4:end].splitlines():
+                key, sep, value = line.partition(":")
+                if sep:
+                    meta[key.strip()] = value.strip().strip("\"'")
+            text = text[end + 5:]
+    parts = rel_path.replace(os.sep, "/").split("/")
+    lesson = meta.get("lesson", parts[-1])
+    module = meta.get("module", parts[-2] if len(parts) >= 2 else None)
+    phase = meta.get("phase", parts[-3] if len(parts) >= 3 else None)
+    if not phase or not module:
+        raise OutlineError(f"{rel_path}: cannot tell which phase and module this lesson belongs to")
+    return {phase: {module: {lesson: text}}}
+
+
+def is_record_stream(path):
+    return path == "-" or path.endswith(".jsonl")
+
+
+def read_outline_jsonl(path):
+    """
+    Lazily yields (phase, module, lesson_filename, content) records from a
+    JSON Lines file, or from stdin when path is "-". The file is opened and
+    its first record read right away, so a missing, unreadable or malformed
+    source is an OutlineError before anything is generated from it; a bad
+    record further in stops the stream where it is.
+    """
+    try:
+        f = sys.stdin.buffer if path == "-" else open(path, "rb")
+    except OSError as error:
+        raise OutlineError(f"{path}: {error.strerror}") from None
+    records = _jsonl_records(path, f)
+    first = next(records, None)
+    return records if first is None else itertools.chain([first], records)
+
+
+def _jsonl_records(path, f):
+    try:
+        for line_number, line in enumerate(f, 1):
+            try:
+                line = line.decode("utf-8")
+            except UnicodeDecodeError:
+                raise OutlineError(f"{path}:{line_number}: not valid UTF-8") from None
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as error:
+                raise OutlineError(f"{path}:{line_number}: {error}") from None
+            if isinstance(record, dict):
+                record = [record.get(key) for key in ("phase", "module", "lesson", "content")]
+            if not (isinstance(record, list) and len(record) == 4
+                    and all(isinstance(field, str) for field in record)):
+                raise OutlineError(f"{path}:{line_number}: expected phase, module, lesson and content strings")
+            yield tuple(record)
+    except OSError as error:
+        raise OutlineError(f"{path}: {error.strerror}") from None
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+
+def dump_outline(outline, path):
+    """Writes an outline as a single JSON source file, or as JSON Lines records for a .jsonl path."""
+    with open(path, "w", encoding="utf-8") as f:
+        if is_record_stream(path):
+            for phase_name, modules_dict in outline.items():
+                for module_name, lessons_dict in modules_dict.items():
+                    for lesson_filename, content in lessons_dict.items():
+                        record = [phase_name, module_name, lesson_filename, content]
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            return
+        json.dump(outline, f, indent=2, ensure_ascii=False)
+        f.write("\n")
@@ -0,0 +1,310 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import artifact_cache
+import generate
+
+# Renders the R Markdown (.Rmd) documents of a course tree, e.g. the lessons
+# in Module_1.4_Functions_and_Packages/project_1.4, next to their sources.
+#
+# Every document's build key is the hash of its own source plus everything
+# it pulls in (knitr child documents and source()d R scripts, recursively).
+# A document is rendered again only if that key or the formats listed under
+# `output:` in its YAML header changed, or an expected output is missing.
+# Documents that are only ever used as children are not rendered on their
+# own. With an artifact cache (see artifact_cache.py), outputs already
+# rendered from the same sources and options are copied in instead. The
+# remaining work is spread over a process pool.
+#
+# The renderer is a command template. {input}, {format} and {output_dir} are
+# substituted in each argument. The default calls rmarkdown through Rscript,
+# and "fake" writes placeholder outputs so the pipeline can be exercised on
+# machines without R.
+
+state_filename = ".render_state.json"
+default_renderer = "Rscript -e \"rmarkdown::render('{input}', output_format = '{format}', output_dir = '{output_dir}')\""
+
+# output format -> extension of the file it produces
+format_extensions = {
+    "pdf_document": ".pdf",
+    "html_document": ".html",
+    "word_document": ".docx",
+    "md_document": ".md",
+    "github_document": ".md",
+    "beamer_presentation": ".pdf",
+    "ioslides_presentation": ".html",
+    "slidy_presentation": ".html",
+}
+
+child_pattern = re.compile(r"""child\s*=\s*(?:c\()?\s*((?:["'][^"']+["']\s*,?\s*)+)""")
+source_pattern = re.compile(r"""\bsource\(\s*["']([^"']+)["']""")
+quoted_pattern = re.compile(r"""["']([^"']+)["']""")
+
+
+def find_rmd_files(root):
+    """Returns every .Rmd file under root, skipping hidden directories, in sorted order."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(name for name in dirnames if not name.startswith("."))
+        found.extend(os.path.normpath(os.path.join(dirpath, name))
+                     for name in sorted(filenames) if name.endswith(".Rmd"))
+    return found
+
+
+def output_formats(text):
+    """
+    Reads the formats under `output:` in the YAML header, accepting both
+    `output: pdf_document` and an indented list of `format: options` keys.
+    Without a header, rmarkdown's default of html_document applies.
+    """
+    if not text.startswith("---"):
+        return ["html_document"]
+    end = text.find("\n---", 3)
+    header = text[3:end if end != -1 else len(text)].splitlines()
+    formats = []
+    for i, line in enumerate(header):
+        if not line.startswith("output:"):
+            continue
+        value = line[len("output:"):].strip()
+        if value:
+            return [value.strip("\"'")]
+        for item in header[i + 1:]:
+            if item and not item[0].isspace():
+                break
+            stripped = item.strip()
+            # Only the first indentation level names formats; deeper lines are their options.
+            if stripped and len(item) - len(item.lstrip()) <= 2 and ":" in stripped:
+                formats.append(stripped.split(":", 1)[0].strip())
+        break
+    return formats or ["html_document"]
+
+
+def dependencies(path, text):
+    """Returns the files a document includes: knitr child documents and source()d scripts."""
+    base = os.path.dirname(path)
+    deps = []
+    for match in child_pattern.finditer(text):
+        deps.extend(os.path.normpath(os.path.join(base, name)) for name in quoted_pattern.findall(match.group(1)))
+    deps.extend(os.path.normpath(os.path.join(base, name)) for name in source_pattern.findall(text))
+    return deps
+
+
+def build_graph(paths):
+    """
+    Reads each document once and returns {path: {"digest", "formats", "deps"}}
+    for the documents and every file they depend on.
+    """
+    graph = {}
+    pending = list(paths)
+    while pending:
+        path = pending.pop()
+        if path in graph:
+            continue
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            graph[path] = {"digest": None, "formats": [], "deps": []}
+            continue
+        node = {"digest": hashlib.sha256(data).hexdigest(), "formats": [], "deps": []}
+        if path.endswith(".Rmd"):
+            text = data.decode("utf-8", errors="replace")
+            node["formats"] = output_formats(text)
+            node["deps"] = dependencies(path, text)
+            pending.extend(node["deps"])
+        graph[path] = node
+    return graph
+
+
+def build_key(graph, path, root=".", visiting=None):
+    """
+    Combines the digests of a document and, recursively, of everything it
+    depends on. Paths enter the key relative to root, so the same sources
+    give the same key in any checkout.
+    """
+    visiting = visiting or set()
+    if path in visiting:
+        raise ValueError(f"dependency cycle through {path}")
+    visiting = visiting | {path}
+    node = graph[path]
+    parts = [(os.path.relpath(path, root), node["digest"] or "missing")]
+    parts.extend((os.path.relpath(dep, root), build_key(graph, dep, root, visiting)) for dep in node["deps"])
+    return generate.combined_hash(parts)
+
+
+def expected_outputs(path, formats):
+    stem = os.path.splitext(path)[0]
+    return [stem + format_extensions[fmt] for fmt in formats if fmt in format_extensions]
+
+
+def render_command(template, path, fmt):
+    """Builds the argv for rendering path to fmt from a command template."""
+    path = os.path.abspath(path)
+    values = {"input": path, "format": fmt, "output_dir": os.path.dirname(path)}
+    return [arg.format(**values) for arg in shlex.split(template)]
+
+
+def fake_render(path, fmt):
+    """Stands in for rmarkdown: writes a small placeholder for each output."""
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    stem = os.path.splitext(path)[0]
+    with open(stem + format_extensions.get(fmt, ".out"), "w", encoding="utf-8") as f:
+        f.write(f"fake {fmt} rendering of {os.path.basename(path)} ({digest})\n")
+
+
+def render_document(path, formats, renderer):
+    """Renders one document to each of its formats. Runs in a worker process."""
+    for fmt in formats:
+        if renderer == "fake":
+            fake_render(path, fmt)
+            continue
+        result = subprocess.run(render_command(renderer, path, fmt), capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"{fmt} failed with exit code {result.returncode}:\n{result.stderr.strip()}")
+    return path
+
+
+def load_state(root):
+    try:
+        with open(os.path.join(root, state_filename), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(root, state):
+    path = os.path.join(root, state_filename)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def plan_renders(root, force=False):
+    """
+    Returns (to_render, up_to_date, state): the documents needing a render as
+    (path, formats, key) tuples, the relative paths that are current, and the
+    previous render state.
+    """
+    documents = find_rmd_files(root)
+    graph = build_graph(documents)
+    children = {dep for path in documents for dep in graph[path]["deps"]}
+    state = load_state(root)
+    to_render, up_to_date = [], []
+    for path in documents:
+        if path in children:
+            continue
+        rel_path = os.path.relpath(path, root)
+        key = build_key(graph, path, root)
+        formats = graph[path]["formats"]
+        previous = state.get(rel_path, {})
+        current = (not force and previous.get("key") == key and previous.get("formats") == formats
+                   and all(os.path.exists(output) for output in expected_outputs(path, formats)))
+        if current:
+            up_to_date.append(rel_path)
+        else:
+            to_render.append((path, formats, key))
+    return to_render, up_to_date, state
+
+
+def restore_cached(cache, to_render, renderer, root, state, result):
+    """
+    Copies in the outputs of documents found in the cache and returns the
+    remaining (path, formats, key, cache_key) tuples that need a render.
+    """
+    remaining = []
+    for path, formats, key in to_render:
+        cache_key = artifact_cache.cache_key(key, {"formats": formats, "renderer": renderer})
+        if cache is not None and cache.get(cache_key, os.path.dirname(path)) is not None:
+            rel_path = os.path.relpath(path, root)
+            state[rel_path] = {"key": key, "formats": formats}
+            result["cached"].append(rel_path)
+            generate.logger.info("  restored  %s from the cache", rel_path)
+            continue
+        remaining.append((path, formats, key, cache_key))
+    return remaining
+
+
+def render_tree(root, renderer=default_renderer, jobs=None, force=False, dry_run=False, cache=None):
+    """
+    Renders every out-of-date document under root on up to `jobs` processes
+    and records the result in the render state. Documents found in `cache`
+    (an artifact_cache.ArtifactCache) are restored instead, and fresh renders
+    are stored in it. Returns {"rendered", "cached", "skipped", "failed"}
+    lists of paths relative to root; documents that failed keep their old
+    state and are retried next time.
+    """
+    to_render, up_to_date, state = plan_renders(root, force)
+    result = {"rendered": [], "cached": [], "skipped": up_to_date, "failed": []}
+    for rel_path in up_to_date:
+        generate.logger.debug("  up to date  %s", rel_path)
+    if dry_run:
+        result["rendered"] = [os.path.relpath(path, root) for path, _, _ in to_render]
+        for rel_path in result["rendered"]:
+            generate.logger.info("  would render  %s", rel_path)
+        return result
+
+    # --force means render again, so the cache is only filled, not read.
+    to_render = restore_cached(None if force else cache, to_render, renderer, root, state, result)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [(path, formats, key, cache_key, pool.submit(render_document, path, formats, renderer))
+                   for path, formats, key, cache_key in to_render]
+        for path, formats, key, cache_key, future in futures:
+            rel_path = os.path.relpath(path, root)
+            try:
+                future.result()
+            except (OSError, RuntimeError) as error:
+                result["failed"].append(rel_path)
+                generate.logger.warning("  failed  %s: %s", rel_path, error)
+                continue
+            state[rel_path] = {"key": key, "formats": formats}
+            result["rendered"].append(rel_path)
+            generate.logger.info("  rendered  %s (%s)", rel_path, ", ".join(formats))
+            outputs = [output for output in expected_outputs(path, formats) if os.path.exists(output)]
+            if cache is not None and outputs:
+                cache.put(cache_key, outputs)
+    save_state(root, state)
+    if cache is not None:
+        cache.save()
+    generate.logger.info("Rendered %d document(s), %d from the cache, %d up to date, %d failed.",
+                         len(result["rendered"]), len(result["cached"]), len(result["skipped"]),
+                         len(result["failed"]))
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the R Markdown documents of a course tree.")
+    parser.add_argument("root", nargs="?", default=generate.base_course_dir,
+                        help=f"course tree to render (default: {generate.base_course_dir})")
+    parser.add_argument("-j", "--jobs", type=int, help="number of render processes (default: CPU count)")
+    parser.add_argument("--renderer", default=default_renderer,
+                        help="command template with {input}, {format} and {output_dir} placeholders, "
+                             "or 'fake' for placeholder outputs without R")
+    parser.add_argument("--force", action="store_true", help="render every document regardless of state")
+    parser.add_argument("--dry-run", action="store_true", help="list the documents that would be rendered")
+    parser.add_argument("--cache-dir", default=artifact_cache.default_cache_dir,
+                        help=f"artifact cache of rendered outputs (default: {artifact_cache.default_cache_dir})")
+    parser.add_argument("--cache-size", type=artifact_cache.parse_size, default=artifact_cache.default_max_bytes,
+                        help="size budget of the artifact cache, e.g. 500M or 2G (default: 1G)")
+    parser.add_argument("--no-cache", action="store_true", help="neither read nor fill the artifact cache")
+    parser.add_argument("-v", "--verbose", action="store_true", help="also list up-to-date documents")
+    args = parser.parse_args(argv)
+    generate.configure_logging(1 if args.verbose else 0)
+    cache = None if args.no_cache or args.dry_run else artifact_cache.ArtifactCache(args.cache_dir, args.cache_size)
+    try:
+        result = render_tree(args.root, args.renderer, args.jobs, args.force, args.dry_run, cache)
+    except ValueError as error:
+        parser.exit(1, f"error: {error}\n")
+    if result["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+import argparse
+import bisect
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+
+import generate
+
+# Full-text search over a generated course. Lesson bodies (.md and .Rmd) are
+# tokenized into lowercase words plus R identifiers, which are first-class
+# terms: anything quoted in backticks that looks like a name or a call
+# (`lm()`, `dplyr::mutate`) and every function called inside a fenced code
+# chunk. Identifier terms are stored with a leading backtick, so `lm` the
+# function and "lm" the word are kept apart, and dplyr::mutate is also
+# indexed as plain `mutate.
+#
+# The postings live in one compact binary file that queries mmap and binary
+# search without loading it:
+#
+#   header   magic, version, number of documents, number of terms
+#   docs     (path offset, path length) per document, then the UTF-8 paths
+#   terms    (term offset, term length, postings offset, postings count)
+#            per term, sorted by the term's UTF-8 bytes, then the terms
+#   postings (document number, occurrences) pairs, per term
+#
+# Updates are incremental per lesson: a JSON side file keeps each lesson's
+# size, mtime, hash and term counts, so only lessons that changed are read
+# and tokenized again; the binary file is then rewritten from those counts.
+
+index_filename = ".search_index"
+docs_filename = ".search_docs.json"
+index_magic = b"CRSI"
+index_version = 1
+source_extensions = (".md", ".Rmd")
+
+header_struct = struct.Struct("<4sIII")
+doc_struct = struct.Struct("<II")
+term_struct = struct.Struct("<IIII")
+posting_struct = struct.Struct("<II")
+
+word_pattern = re.compile(r"[a-z0-9_][a-z0-9_.]*")
+backtick_pattern = re.compile(r"`([^`\n]+)`")
+identifier_pattern = re.compile(r"^([A-Za-z.][A-Za-z0-9_.]*(?:::[A-Za-z.][A-Za-z0-9_.]*)?)(?:\(\))?$")
+call_pattern = re.compile(r"([A-Za-z.][A-Za-z0-9_.]*(?:::[A-Za-z.][A-Za-z0-9_.]*)?)\s*\(")
+fence_pattern = re.compile(r"^\s*```")
+
+
+def identifier_terms(name):
+    """Returns the terms for an R identifier: `name, plus `fn for pkg::fn."""
+    terms = ["`" + name]
+    if "::" in name:
+        terms.append("`" + name.split("::", 1)[1])
+    return terms
+
+
+def tokenize(text):
+    """Returns {term: occurrences} for a lesson body."""
+    counts = {}
+
+    def add(term):
+        counts[term] = counts.get(term, 0) + 1
+
+    in_code = False
+    for line in text.splitlines():
+        if fence_pattern.match(line):
+            in_code = not in_code
+            continue
+        if in_code:
+            for name in call_pattern.findall(line):
+                for term in identifier_terms(name):
+                    add(term)
+        else:
+            for quoted in backtick_pattern.findall(line):
+                match = identifier_pattern.match(quoted.strip())
+                if match:
+                    for term in identifier_terms(match.group(1)):
+                        add(term)
+        for word in word_pattern.findall(line.lower()):
+            add(word.rstrip("."))
+    counts.pop("", None)
+    return counts
+
+
+def query_terms(query):
+    """
+    Turns a query into a list of term groups, each matched by any of its
+    terms. Backtick-quoted words, calls like lm() and namespaced names
+    become identifier terms, with dplyr::mutate also matching a bare
+    `mutate (as lessons that mention both are indexed); anything else is
+    tokenized into words.
+    """
+    groups = []
+    for part in query.split():
+        stripped = part.strip("`")
+        match = identifier_pattern.match(stripped)
+        if match and (part.startswith("`") or stripped.endswith("()") or "::" in stripped):
+            groups.append(identifier_terms(match.group(1)))
+        else:
+            groups.extend([word.rstrip(".")] for word in word_pattern.findall(part.lower()))
+    return [group for group in groups if group[0]]
+
+
+def find_sources(root):
+    """Returns the relative paths of the lessons under root, skipping hidden entries."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(name for name in dirnames if not name.startswith("."))
+        found.extend(os.path.relpath(os.path.join(dirpath, name), root)
+                     for name in sorted(filenames) if name.endswith(source_extensions) and not name.startswith("."))
+    return found
+
+
+def load_docs(root):
+    try:
+        with open(os.path.join(root, docs_filename), encoding="utf-8") as f:
+            docs = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return docs if isinstance(docs, dict) else {}
+
+
+def save_docs(root, docs):
+    path = os.path.join(root, docs_filename)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(docs, f, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+
+def write_index(path, docs):
+    """Writes the compact postings file for docs ({rel_path: {"terms": {term: n}}})."""
+    paths = sorted(docs)
+    postings = {}
+    for number, rel_path in enumerate(paths):
+        for term, count in docs[rel_path]["terms"].items():
+            postings.setdefault(term.encode("utf-8"), []).append((number, count))
+    terms = sorted(postings)
+
+    encoded_paths = [p.encode("utf-8") for p in paths]
+    doc_table = bytearray()
+    offset = 0
+    for encoded in encoded_paths:
+        doc_table += doc_struct.pack(offset, len(encoded))
+        offset += len(encoded)
+    term_table = bytearray()
+    term_offset = posting_offset = 0
+    for term in terms:
+        term_table += term_struct.pack(term_offset, len(term), posting_offset, len(postings[term]))
+        term_offset += len(term)
+        posting_offset += len(postings[term])
+
+    with open(path + ".tmp", "wb") as f:
+        f.write(header_struct.pack(index_magic, index_version, len(paths), len(terms)))
+        f.write(doc_table)
+        f.write(b"".join(encoded_paths))
+        f.write(term_table)
+        f.write(b"".join(terms))
+        for term in terms:
+            f.write(b"".join(posting_struct.pack(number, count) for number, count in postings[term]))
+    os.replace(path + ".tmp", path)
+
+
+def update_index(root, rebuild=False):
+    """
+    Brings the search index of the course under root up to date, reading and
+    tokenizing only the lessons whose size, mtime and content changed.
+    Returns {"indexed", "reused", "removed", "documents", "terms"}.
+    """
+    docs = {} if rebuild else load_docs(root)
+    stats = {"indexed": 0, "reused": 0, "removed": 0}
+    current = {}
+    touched = False
+    for rel_path in find_sources(root):
+        path = os.path.join(root, rel_path)
+        st = os.stat(path)
+        entry = docs.get(rel_path)
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            current[rel_path] = entry
+            stats["reused"] += 1
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = generate.content_hash(data)
+        if entry and entry["sha256"] == digest:
+            entry["mtime_ns"] = st.st_mtime_ns
+            touched = True
+            current[rel_path] = entry
+            stats["reused"] += 1
+            continue
+        current[rel_path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest,
+                             "terms": tokenize(data.decode("utf-8", errors="replace"))}
+        stats["indexed"] += 1
+        generate.logger.debug("  indexed  %s", rel_path)
+    stats["removed"] = len(set(docs) - set(current))
+
+    index_path = os.path.join(root, index_filename)
+    if stats["indexed"] or stats["removed"] or not os.path.exists(index_path):
+        write_index(index_path, current)
+        save_docs(root, current)
+    elif touched:
+        # Only mtimes moved; keep the side file in step so the next run can skip those lessons.
+        save_docs(root, current)
+    stats["documents"] = len(current)
+    stats["terms"] = len({term for entry in current.values() for term in entry["terms"]})
+    generate.logger.info("Search index: %d lesson(s) indexed, %d unchanged, %d removed.",
+                         stats["indexed"], stats["reused"], stats["removed"])
+    return stats
+
+
+class SearchIndex:
+    """Read-only view of a postings file, memory-mapped."""
+
+    def __init__(self, root):
+        with open(os.path.join(root, index_filename), "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.doc_count, self.term_count = header_struct.unpack_from(self.map, 0)
+        if magic != index_magic or version != index_version:
+            self.map.close()
+            raise ValueError(f"{os.path.join(root, index_filename)} is not a search index of version {index_version}")
+        self.docs_start = header_struct.size
+        self.paths_start = self.docs_start + self.doc_count * doc_struct.size
+        last_offset, last_length = (doc_struct.unpack_from(self.map, self.paths_start - doc_struct.size)
+                                    if self.doc_count else (0, 0))
+        self.terms_start = self.paths_start + last_offset + last_length
+        self.term_text_start = self.terms_start + self.term_count * term_struct.size
+        if self.term_count:
+            offset, length, _, _ = term_struct.unpack_from(self.map, self.term_text_start - term_struct.size)
+            self.postings_start = self.term_text_start + offset + length
+        else:
+            self.postings_start = self.term_text_start
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def path(self, number):
+        offset, length = doc_struct.unpack_from(self.map, self.docs_start + number * doc_struct.size)
+        start = self.paths_start + offset
+        return self.map[start:start + length].decode("utf-8")
+
+    def term(self, i):
+        offset, length, _, _ = term_struct.unpack_from(self.map, self.terms_start + i * term_struct.size)
+        start = self.term_text_start + offset
+        return self.map[start:start + length]
+
+    def postings(self, term):
+        """Returns {document number: occurrences} for a term, empty if it is not indexed."""
+        key = term.encode("utf-8")
+        i = bisect.bisect_left(_TermView(self), key)
+        if i == self.term_count or self.term(i) != key:
+            return {}
+        _, _, offset, count = term_struct.unpack_from(self.map, self.terms_start + i * term_struct.size)
+        start = self.postings_start + offset * posting_struct.size
+        return dict(posting_struct.iter_unpack(self.map[start:start + count * posting_struct.size]))
+
+    def search(self, query, limit=20):
+        """
+        Returns up to `limit` (relative path, score) pairs for the lessons
+        containing every term of the query, best first. The score is the
+        total number of occurrences of the query terms, so a lesson naming
+        dplyr::mutate ranks above one that only has a bare mutate().
+        """
+        groups = query_terms(query)
+        if not groups:
+            return []
+        matches = None
+        for group in groups:
+            postings = {}
+            for term in group:
+                for number, n in self.postings(term).items():
+                    postings[number] = postings.get(number, 0) + n
+            if matches is None:
+                matches = postings
+            else:
+                matches = {number: matches[number] + n for number, n in postings.items() if number in matches}
+            if not matches:
+                return []
+        ranked = sorted(matches.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [(self.path(number), score) for number, score in ranked]
+
+
+class _TermView:
+    """Sequence over the sorted terms of an index, for bisect."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return self.index.term_count
+
+    def __getitem__(self, i):
+        return self.index.term(i)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the full-text search index of a course.")
+    parser.add_argument("query", nargs="*",
+                        help="terms every result must contain, e.g. dplyr::mutate or 'lm()'; "
+                             "without a query the index is only brought up to date")
+    parser.add_argument("--root", default=generate.base_course_dir,
+                        help=f"course tree to index (default: {generate.base_course_dir})")
+    parser.add_argument("--no-update", action="store_true", help="query the index as it is, without updating it")
+    parser.add_argument("--rebuild", action="store_true", help="re-tokenize every lesson")
+    parser.add_argument("-n", "--limit", type=int, default=20, help="maximum number of results (default: 20)")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every lesson that is re-indexed")
+    args = parser.parse_args(argv)
+    generate.configure_logging(1 if args.verbose else 0 if not args.query else -1)
+    if not args.no_update:
+        update_index(args.root, rebuild=args.rebuild)
+    if not args.query:
+        return
+    try:
+        with SearchIndex(args.root) as index:
+            results = index.search(" ".join(args.query), args.limit)
+    except (OSError, ValueError) as error:
+        parser.exit(1, f"error: {error}\n")
+    if args.json:
+        print(json.dumps([{"path": path, "score": score} for path, score in results], indent=2))
+    else:
+        for path, score in results:
+            print(f"{score:6}  {path}")
+    if not results:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import bench  # noqa: E402
+
+course = os.path.join(root, "course.py")
+
+# The budget for `course.py --help`, in milliseconds; see bench.py --startup.
+startup_budget = 50.0
+
+
+def test_help_is_within_startup_budget():
+    median = bench.measure_startup([[course, "--help"]], runs=10)[f"{course} --help"]
+    assert median <= startup_budget, f"course.py --help took {median:.1f} ms (budget {startup_budget:.0f} ms)"
+
+
+def test_help_imports_no_subcommand_module():
+    script = ("import sys; sys.argv = ['course.py', '--help']; import course; course.main(); "
+              "print(sorted(set(sys.modules) & {'argparse', 'generate', 'outline_io', 'sqlite3'}))")
+    result = subprocess.run([sys.executable, "-c", script], cwd=root, capture_output=True, text=True, check=True)
+    assert result.stdout.strip().splitlines()[-1] == "[]"
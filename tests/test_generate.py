@@ -0,0 +1,133 @@
+import hashlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generate  # noqa: E402
+
+generate.configure_logging(-1)
+
+
+def make_outline(**lessons):
+    return {"Phase_1_Basics": {"Module_1.1_Start": {f"{name}.md": text for name, text in lessons.items()}}}
+
+
+def lesson_path(base_dir, name):
+    return os.path.join(base_dir, "Phase_1_Basics", "Module_1.1_Start", f"{name}.md")
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_incremental_noop_keeps_mtimes(tmp_path):
+    base_dir = str(tmp_path / "course")
+    outline = make_outline(a="alpha\n", b="beta\n")
+    generate.create_course_materials(base_dir, outline)
+    mtimes = {name: os.stat(lesson_path(base_dir, name)).st_mtime_ns for name in "ab"}
+
+    summary = generate.create_course_materials(base_dir, outline, incremental=True)
+
+    assert summary["files_written"] == 0
+    assert {name: os.stat(lesson_path(base_dir, name)).st_mtime_ns for name in "ab"} == mtimes
+
+
+def test_staged_publish_and_rollback(tmp_path):
+    base_dir = str(tmp_path / "course")
+    generate.create_course_materials(base_dir, make_outline(a="first\n"), staged=True)
+    with open(os.path.join(base_dir, "notes.txt"), "w") as f:
+        f.write("keep me\n")
+
+    generate.create_course_materials(base_dir, make_outline(a="second\n"), staged=True, incremental=True)
+    assert read(lesson_path(base_dir, "a")) == "second\n"
+    assert read(lesson_path(base_dir + generate.previous_suffix, "a")) == "first\n"
+
+    generate.create_course_materials(base_dir, make_outline(a="third\n"), staged=True, incremental=True)
+    assert read(os.path.join(base_dir, "notes.txt")) == "keep me\n"
+
+    generate.rollback_course(base_dir)
+    assert read(lesson_path(base_dir, "a")) == "second\n"
+    assert read(lesson_path(base_dir + generate.previous_suffix, "a")) == "third\n"
+
+
+def test_rebuild_does_not_write_through_dedup_links(tmp_path):
+    base_dir = str(tmp_path / "course")
+    outline = make_outline(a="same\n", b="same\n")
+    generate.create_course_materials(base_dir, outline, staged=True, dedup=True)
+    generate.create_course_materials(base_dir, outline, staged=True, dedup=True, incremental=True)
+    previous_dir = base_dir + generate.previous_suffix
+    assert os.path.samefile(lesson_path(base_dir, "a"), lesson_path(previous_dir, "a"))
+
+    generate.create_course_materials(base_dir, make_outline(a="edited\n", b="same\n"), incremental=True)
+
+    assert read(lesson_path(base_dir, "a")) == "edited\n"
+    assert read(lesson_path(base_dir, "b")) == "same\n"
+    assert read(lesson_path(previous_dir, "a")) == "same\n"
+    blob_dir = os.path.join(base_dir, generate.blob_dirname)
+    blobs = [os.path.join(dirpath, name) for dirpath, _, names in os.walk(blob_dir) for name in names]
+    assert blobs
+    for path in blobs:
+        with open(path, "rb") as f:
+            assert hashlib.sha256(f.read()).hexdigest() == os.path.basename(path)
+
+
+def test_failed_run_resumes_from_journal(tmp_path):
+    base_dir = str(tmp_path / "course")
+    outline = make_outline(a="alpha\n", b="beta\n", c="gamma\n")
+    os.makedirs(lesson_path(base_dir, "b"))  # a directory where a lesson goes makes its write fail
+
+    with pytest.raises(generate.CourseGenerationError):
+        generate.create_course_materials(base_dir, outline)
+    journal_path = os.path.join(base_dir, generate.journal_filename)
+    assert set(generate.load_journal(journal_path)["files"]) >= {"README.md", "Phase_1_Basics/Module_1.1_Start/a.md"}
+
+    os.rmdir(lesson_path(base_dir, "b"))
+    os.remove(lesson_path(base_dir, "a"))
+    summary = generate.create_course_materials(base_dir, outline, resume=True)
+
+    assert {name: read(lesson_path(base_dir, name)) for name in "abc"} == {"a": "alpha\n", "b": "beta\n",
+                                                                         "c": "gamma\n"}
+    assert summary["files_written"] == 2
+    assert not os.path.exists(journal_path)
+
+
+def test_resume_skips_finished_modules_without_stat(tmp_path, monkeypatch):
+    base_dir = str(tmp_path / "course")
+    outline = make_outline(a="alpha\n", b="beta\n")
+    outline["Phase_1_Basics"]["Module_1.2_Next"] = {"c.md": "gamma\n"}
+    failing = os.path.join(base_dir, "Phase_1_Basics", "Module_1.2_Next", "c.md")
+    os.makedirs(failing)
+
+    with pytest.raises(generate.CourseGenerationError):
+        generate.create_course_materials(base_dir, outline)
+    journal = generate.load_journal(os.path.join(base_dir, generate.journal_filename))
+    assert set(journal["modules"]) == {"Phase_1_Basics/Module_1.1_Start"}
+
+    os.rmdir(failing)
+    checked = []
+    size = generate.disk_backend.size
+    monkeypatch.setattr(generate.disk_backend, "size", lambda path: checked.append(path) or size(path))
+    summary = generate.create_course_materials(base_dir, outline, resume=True)
+
+    assert summary["files_written"] == 1
+    assert read(failing) == "gamma\n"
+    assert not [path for path in checked if "Module_1.1_Start" in path]
+
+
+@pytest.mark.parametrize("name, data", [("missing.jsonl", None),
+                                        ("latin1.jsonl", '["P", "M", "a.md", "caf\xe9"]\n'.encode("latin-1"))])
+def test_bad_record_stream_fails_before_generating(tmp_path, name, data):
+    source = tmp_path / name
+    if data is not None:
+        source.write_bytes(data)
+    base_dir = tmp_path / "course"
+
+    with pytest.raises(SystemExit) as excinfo:
+        generate.main(["--outline", str(source), "--output", str(base_dir), "-q"])
+
+    assert excinfo.value.code == 1
+    assert not base_dir.exists()
@@ -0,0 +1,106 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Span recording for generate.py. A Tracer collects timed spans for each
+# stage of a run (directory creation, content preparation, file open, write,
+# ...) plus one span per phase and module covering all of its work, and
+# exports them in the Chrome trace event format, which chrome://tracing and
+# https://ui.perfetto.dev both open. generate.null_tracer stands in when
+# tracing is off, so untraced runs never import this module.
+
+# Upper bounds, in microseconds, of the histogram buckets for stage durations.
+bucket_bounds = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 100000, 1000000)
+
+
+class Tracer:
+    enabled = True
+
+    def __init__(self):
+        self.start_ns = time.perf_counter_ns()
+        self.events = []
+        # (category, name) -> [first_ns, last_ns, args], for phases and modules
+        self.groups = {}
+        self.thread_ids = {}
+        self.lock = threading.Lock()
+
+    def _tid(self):
+        ident = threading.get_ident()
+        tid = self.thread_ids.get(ident)
+        if tid is None:
+            with self.lock:
+                tid = self.thread_ids.setdefault(ident, len(self.thread_ids) + 1)
+        return tid
+
+    @contextmanager
+    def span(self, stage, detail=None):
+        """Times the enclosed block as one occurrence of `stage`."""
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.events.append((stage, detail, start, time.perf_counter_ns(), self._tid()))
+
+    def touch(self, category, name):
+        """Extends the span of a phase or module to cover the current moment."""
+        now = time.perf_counter_ns()
+        group = self.groups.get((category, name))
+        if group is None:
+            self.groups[(category, name)] = [now, now]
+        else:
+            group[1] = now
+
+    def histogram(self):
+        """Aggregates span durations per stage: count, total, mean, p50/p95/max and buckets."""
+        durations = {}
+        for stage, _, start, end, _ in self.events:
+            durations.setdefault(stage, []).append((end - start) / 1000)
+        result = {}
+        for stage, values in durations.items():
+            values.sort()
+            buckets = [0] * (len(bucket_bounds) + 1)
+            bound = 0
+            for value in values:
+                while bound < len(bucket_bounds) and value > bucket_bounds[bound]:
+                    bound += 1
+                buckets[bound] += 1
+            labels = [f"<={b}us" for b in bucket_bounds] + [f">{bucket_bounds[-1]}us"]
+            result[stage] = {
+                "count": len(values),
+                "total_us": round(sum(values), 1),
+                "mean_us": round(sum(values) / len(values), 2),
+                "p50_us": round(values[len(values) // 2], 2),
+                "p95_us": round(values[min(len(values) - 1, int(len(values) * 0.95))], 2),
+                "max_us": round(values[-1], 2),
+                "buckets": {label: n for label, n in zip(labels, buckets) if n},
+            }
+        return result
+
+    def chrome_events(self):
+        events = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid,
+                   "args": {"name": "main" if tid == 1 else f"worker-{tid - 1}"}}
+                  for tid in sorted(self.thread_ids.values())]
+        for (category, name), (first, last) in self.groups.items():
+            events.append({"name": name, "cat": category, "ph": "X", "pid": 1, "tid": 0,
+                           "ts": (first - self.start_ns) / 1000, "dur": (last - first) / 1000})
+        for stage, detail, start, end, tid in self.events:
+            event = {"name": stage, "cat": "stage", "ph": "X", "pid": 1, "tid": tid,
+                     "ts": (start - self.start_ns) / 1000, "dur": (end - start) / 1000}
+            if detail is not None:
+                event["args"] = {"path": detail}
+            events.append(event)
+        return events
+
+    def export_chrome(self, path):
+        """Writes the trace as Chrome trace JSON, with the stage histogram under otherData."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.chrome_events(), "displayTimeUnit": "ms",
+                       "otherData": {"histogram": self.histogram()}}, f)
+
+    def format_histogram(self):
+        lines = [f"{'stage':<10} {'count':>8} {'total ms':>10} {'mean us':>9} {'p50 us':>9} {'p95 us':>9} {'max us':>9}"]
+        for stage, h in sorted(self.histogram().items(), key=lambda item: -item[1]["total_us"]):
+            lines.append(f"{stage:<10} {h['count']:>8} {h['total_us'] / 1000:>10.2f} {h['mean_us']:>9.1f} "
+                         f"{h['p50_us']:>9.1f} {h['p95_us']:>9.1f} {h['max_us']:>9.1f}")
+        return "\n".join(lines)
@@ -0,0 +1,292 @@
+import ctypes
+import os
+import select
+import struct
+import sys
+import time
+
+import generate
+
+# Watch mode for generate.py. The outline sources are watched with inotify
+# on Linux (through libc, no extra packages) or by polling their mtimes
+# elsewhere. Both report which files changed (inotify by name, polling by
+# size and mtime); after a burst of edits settles, only those sources are
+# parsed again (outline_io.OutlineSources), and only the lessons they added,
+# changed or removed are written or deleted, with the manifest hashes of just
+# the affected modules and phases redone. The built-in outline in generate.py
+# is a single Python file, so edits to it reload and diff the whole outline.
+
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+watch_mask = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+event_header = struct.Struct("iIII")
+
+
+def watched_dirs(path):
+    """Returns (directory, names of interest or None for all) pairs covering path."""
+    if os.path.isfile(path):
+        return [(os.path.dirname(os.path.abspath(path)), {os.path.basename(path)})]
+    dirs = []
+    for dirpath, dirnames, _ in os.walk(path):
+        dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+        dirs.append((dirpath, None))
+    return dirs
+
+
+class InotifyWatcher:
+    """Blocks until something under the watched paths changes, using inotify."""
+
+    def __init__(self, paths):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths = paths
+        self.watches = {}
+        self.changed = set()
+        self.add_watches()
+
+    def add_watches(self):
+        for path in self.paths:
+            for directory, names in watched_dirs(path):
+                wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), watch_mask)
+                if wd >= 0:
+                    self.watches[wd] = (directory, names)
+
+    def wait(self, timeout=None):
+        """Returns True once a relevant event arrives, False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            if not ready:
+                return False
+            if self.read_events():
+                return True
+
+    def read_events(self):
+        """Collects the paths named by pending events into self.changed; returns whether there were any."""
+        relevant = False
+        try:
+            buffer = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return False
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = event_header.unpack_from(buffer, offset)
+            name = buffer[offset + event_header.size:offset + event_header.size + length].rstrip(b"\0")
+            offset += event_header.size + length
+            if wd not in self.watches:
+                continue
+            directory, names = self.watches[wd]
+            name = os.fsdecode(name)
+            if name.startswith("."):
+                continue
+            if name and names is not None and name not in names:
+                continue
+            self.changed.add(os.path.join(directory, name) if name else directory)
+            relevant = True
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.add_watches()
+        return relevant
+
+    def pop_changes(self):
+        """Returns the paths changed since the last call."""
+        changed, self.changed = self.changed, set()
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Fallback watcher that compares the sizes and mtimes of the sources."""
+
+    def __init__(self, paths, interval=0.5):
+        self.paths = paths
+        self.interval = interval
+        self.changed = set()
+        self.signature = self.snapshot()
+
+    def snapshot(self):
+        """Returns {absolute path: (size, mtime_ns)} for every source."""
+        import outline_io
+        signature = {}
+        for path in self.paths:
+            root = path if os.path.isdir(path) else os.path.dirname(path)
+            try:
+                sources = outline_io.find_sources(path)
+            except OSError:
+                continue
+            for rel_path, size, mtime_ns in sources:
+                signature[os.path.abspath(os.path.join(root, rel_path))] = (size, mtime_ns)
+        return signature
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            signature = self.snapshot()
+            if signature != self.signature:
+                self.changed.update(path for path in signature.keys() | self.signature.keys()
+                                    if signature.get(path) != self.signature.get(path))
+                self.signature = signature
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.interval if deadline is None else min(self.interval, max(0.0, deadline - time.monotonic())))
+
+    def pop_changes(self):
+        changed, self.changed = self.changed, set()
+        return changed
+
+    def close(self):
+        pass
+
+
+def make_watcher(paths, interval=0.5):
+    if sys.platform == "linux":
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(paths, interval)
+
+
+def diff_outlines(old, new):
+    """
+    Returns (changed, removed): the (phase, module, lesson, content) records
+    that are new or different in `new`, and the (phase, module, lesson)
+    triples that `new` no longer has. Untouched modules are skipped with a
+    single dict comparison each.
+    """
+    changed, removed = [], []
+    for phase_name, modules_dict in new.items():
+        old_modules = old.get(phase_name, {})
+        for module_name, lessons_dict in modules_dict.items():
+            old_lessons = old_modules.get(module_name, {})
+            if lessons_dict == old_lessons:
+                continue
+            for lesson_filename, content in lessons_dict.items():
+                if old_lessons.get(lesson_filename) != content:
+                    changed.append((phase_name, module_name, lesson_filename, content))
+            for lesson_filename in old_lessons:
+                if lesson_filename not in lessons_dict:
+                    removed.append((phase_name, module_name, lesson_filename))
+        for module_name, old_lessons in old_modules.items():
+            if module_name not in modules_dict:
+                removed.extend((phase_name, module_name, lesson) for lesson in old_lessons)
+    for phase_name, old_modules in old.items():
+        if phase_name not in new:
+            for module_name, old_lessons in old_modules.items():
+                removed.extend((phase_name, module_name, lesson) for lesson in old_lessons)
+    return changed, removed
+
+
+class ReloadingSource:
+    """
+    Stands in for outline_io.OutlineSources when the outline can only be
+    loaded whole (the built-in outline): update() reloads it and diffs.
+    """
+
+    def __init__(self, load_outline):
+        self.load_outline = load_outline
+        self.outline = load_outline()
+
+    def update(self, paths):
+        outline = self.load_outline()
+        changed, removed = diff_outlines(self.outline, outline)
+        self.outline = outline
+        return changed, removed
+
+
+def apply_changes(base_dir, outline, changed, removed):
+    """
+    Writes the changed lessons, deletes the removed ones and brings the
+    manifest's entries for the affected modules and phases up to date.
+    """
+    manifest = generate.load_manifest(base_dir)
+    for phase_name, module_name, lesson_filename, content in changed:
+        rel_path = f"{phase_name}/{module_name}/{lesson_filename}"
+        path = os.path.join(base_dir, rel_path)
+        data = content.encode("utf-8")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with generate.disk_backend.open_write(path) as f:
+            f.write(data)
+        manifest["files"][rel_path] = {"sha256": generate.content_hash(data), "size": len(data)}
+        generate.logger.info("      Updated lesson file: %s", path)
+    removed_paths = [f"{p}/{m}/{l}" for p, m, l in removed]
+    generate.remove_orphans(base_dir, removed_paths)
+    for rel_path in removed_paths:
+        manifest["files"].pop(rel_path, None)
+        generate.logger.info("      Removed lesson file: %s", os.path.join(base_dir, rel_path))
+
+    # Only the affected modules and phases are hashed again, each in natural
+    # order as compile_outline() orders them for a full run.
+    from outline_io import natural_key
+    affected = {(p, m) for p, m, *_ in changed} | {(p, m) for p, m, _ in removed}
+    for phase_name, module_name in affected:
+        module_key = f"{phase_name}/{module_name}"
+        lessons_dict = outline.get(phase_name, {}).get(module_name)
+        if lessons_dict is None:
+            manifest["modules"].pop(module_key, None)
+            continue
+        manifest["modules"][module_key] = generate.combined_hash(
+            (lesson, manifest["files"][f"{module_key}/{lesson}"]["sha256"])
+            for lesson in sorted(lessons_dict, key=natural_key))
+    for phase_name in {p for p, _ in affected}:
+        modules_dict = outline.get(phase_name)
+        if modules_dict is None:
+            manifest["phases"].pop(phase_name, None)
+            continue
+        manifest["phases"][phase_name] = generate.combined_hash(
+            (module, manifest["modules"][f"{phase_name}/{module}"]) for module in sorted(modules_dict, key=natural_key))
+    generate.save_manifest(base_dir, manifest)
+
+
+def watch_course(base_dir, source, paths, debounce=0.2, interval=0.5, jobs=1):
+    """
+    Brings base_dir up to date incrementally, then keeps it in sync with the
+    outline until interrupted. `source` holds the current outline (an
+    outline_io.OutlineSources or a ReloadingSource) and `paths` are the files
+    or directories it reads.
+    """
+    generate.create_course_materials(base_dir, source.outline, incremental=True, jobs=jobs)
+    watcher = make_watcher(paths, interval)
+    generate.logger.info("Watching %s for changes (Ctrl-C to stop)...", ", ".join(paths))
+    generate.flush_log()
+    try:
+        while True:
+            watcher.wait()
+            # Debounce: let a burst of saves settle before reloading.
+            while watcher.wait(debounce):
+                pass
+            start = time.perf_counter()
+            changed_paths = watcher.pop_changes()
+            try:
+                changed, removed = source.update(changed_paths)
+            except (OSError, ValueError, SyntaxError) as error:
+                # Kept for the next attempt: the sources are reparsed once fixed.
+                watcher.changed |= changed_paths
+                generate.logger.warning("Could not reload the outline: %s", error)
+                generate.flush_log()
+                continue
+            if changed or removed:
+                apply_changes(base_dir, source.outline, changed, removed)
+                generate.logger.info("Applied %d change(s), %d removal(s) in %.1f ms",
+                                     len(changed), len(removed), (time.perf_counter() - start) * 1000)
+            generate.flush_log()
+    except KeyboardInterrupt:
+        generate.logger.info("Stopped watching.")
+    finally:
+        watcher.close()